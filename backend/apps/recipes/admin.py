@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Recipe, Ingredient, RecipeIngredient, Favorite, ShoppingCart
+from .models import (
+    Recipe, Ingredient, RecipeIngredient, Favorite, ShoppingCart,
+    ShoppingListItem
+)
 
 
 @admin.register(Recipe)
@@ -9,10 +12,6 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'author__username')
     list_filter = ('author',)
 
-    def favorites_count(self, obj):
-        return obj.in_favorites.count()
-    favorites_count.short_description = 'В избранном'
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -32,4 +31,9 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe') 
\ No newline at end of file
+    list_display = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount')
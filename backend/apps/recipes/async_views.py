@@ -0,0 +1,214 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from foodgram.db_router import primary, read_from, replica_for
+from .cache import (
+    aget_cached_data, aset_cached_data, detail_cache_key, list_cache_key
+)
+from .conditional import (
+    INGREDIENTS_TABLE, data_etag, make_etag, not_modified,
+    recipe_validators, set_validators
+)
+from .filters import IngredientFilter
+from .ingredient_index import ingredient_index
+from .models import Ingredient, Recipe, TableVersion
+from .serializers import IngredientSerializer, RecipeReadSerializer
+from .shopping_list import (
+    SHOPPING_LIST_FORMATS, ashopping_list_pages, shopping_list_response
+)
+from .views import IngredientViewSet, RecipeViewSet
+
+'''Async-версии горячих GET-эндпоинтов для запуска под ASGI.
+Включаются настройкой ASYNC_VIEWS (foodgram/asgi.py включает её сама) и
+подменяют маршруты роутера для списка и карточки рецепта, поиска
+ингредиентов и выгрузки списка покупок. Данные читаются async ORM,
+поток занимается только там, где нужен синхронный код (аутентификация,
+фильтры). Ответы совпадают с DRF-вьюхами, включая ETag. Всё, что
+async-версия не обрабатывает (запись, фильтры и пагинация списка
+рецептов, ошибки), вьюха передаёт обычному вьюсету в потоке.'''
+
+recipe_list_view = RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipes', detail=False
+)
+recipe_detail_view = RecipeViewSet.as_view(
+    {
+        'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    basename='recipes', detail=True
+)
+# Как у роутера: параметры @action (permission_classes) - в initkwargs.
+download_shopping_cart_view = RecipeViewSet.as_view(
+    {'get': 'download_shopping_cart'}, basename='recipes', detail=False,
+    **RecipeViewSet.download_shopping_cart.kwargs
+)
+ingredient_list_view = IngredientViewSet.as_view(
+    {'get': 'list'}, basename='ingredients', detail=False
+)
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status_code
+    )
+
+
+async def authenticate(request):
+    """Пользователь по тем же классам аутентификации, что у DRF."""
+    for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = await sync_to_async(authenticator().authenticate)(request)
+        if result is not None:
+            request.user = result[0]
+            return result[0]
+    request.user = AnonymousUser()
+    return request.user
+
+
+def async_api_view(sync_view):
+    """GET обрабатывает async-функция, остальное - sync_view в потоке.
+
+    Функция возвращает None, если запрос ей не по силам.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            response = None
+            if request.method in ('GET', 'HEAD'):
+                try:
+                    response = await handler(request, *args, **kwargs)
+                except AuthenticationFailed:
+                    # Ответ 401 с нужными заголовками соберёт DRF.
+                    response = None
+            if response is None:
+                response = await sync_to_async(sync_view)(
+                    request, *args, **kwargs
+                )
+            return response
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+async def conditional_json(request, data):
+    """Ответ с ETag по данным (как для анонима в ConditionalGetMixin)."""
+    etag = data_etag(data)
+    response = not_modified(request, etag) or json_response(data)
+    return set_validators(response, etag)
+
+
+@async_api_view(recipe_list_view)
+async def recipe_list(request):
+    """Анонимный список из кэша ответов.
+
+    Фильтры, пагинация и ETag для пользователя завязаны на DRF, поэтому
+    промах кэша и запросы с токеном уходят в RecipeViewSet.
+    """
+    user = await authenticate(request)
+    if not user.is_anonymous:
+        return None
+    data = await aget_cached_data(
+        await sync_to_async(list_cache_key)(request)
+    )
+    if data is None:
+        return None
+    return await conditional_json(request, data)
+
+
+async def read_recipe(request, user, pk):
+    recipe = await Recipe.objects.for_read(user).filter(pk=pk).afirst()
+    if recipe is None:
+        return None
+    return RecipeReadSerializer(recipe, context={'request': request}).data
+
+
+@async_api_view(recipe_detail_view)
+async def recipe_detail(request, pk):
+    user = await authenticate(request)
+    if user.is_anonymous:
+        key = await sync_to_async(detail_cache_key)(request, str(pk))
+        data = await aget_cached_data(key)
+        if data is None:
+            # Ответ попадёт в кэш: читаем не с реплики.
+            with primary():
+                data = await read_recipe(request, user, pk)
+            if data is None:
+                return json_response(
+                    {'detail': NotFound.default_detail},
+                    status.HTTP_404_NOT_FOUND
+                )
+            await aset_cached_data(key, data)
+        return await conditional_json(request, data)
+
+    # Те же части, что у RecipeViewSet.get_validators.
+    etag = make_etag(
+        [('pk', str(pk))],
+        sorted(request.GET.lists()),
+        *await sync_to_async(recipe_validators)(user, str(pk))
+    )
+    response = not_modified(request, etag)
+    if response is not None:
+        return set_validators(response, etag)
+    with read_from(await sync_to_async(replica_for)(request, user)):
+        data = await read_recipe(request, user, pk)
+    if data is None:
+        return json_response(
+            {'detail': NotFound.default_detail}, status.HTTP_404_NOT_FOUND
+        )
+    return set_validators(json_response(data), etag)
+
+
+@async_api_view(ingredient_list_view)
+async def ingredient_list(request):
+    await authenticate(request)
+    name = request.GET.get('name')
+    if name and settings.INGREDIENT_INDEX_ENABLED:
+        # Как в IngredientViewSet.list: тело и ETag из одного снимка
+        # индекса; поток нужен, только если индекс надо перестроить.
+        snapshot = await sync_to_async(ingredient_index.snapshot)()
+        etag = make_etag([], sorted(request.GET.lists()), snapshot.version)
+        response = not_modified(request, etag) or json_response(
+            snapshot.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+        )
+        return set_validators(response, etag)
+    with read_from(await sync_to_async(replica_for)(request, request.user)):
+        etag = make_etag(
+            [],
+            sorted(request.GET.lists()),
+            await TableVersion.aget_version(INGREDIENTS_TABLE)
+        )
+        response = not_modified(request, etag)
+        if response is None:
+            queryset = await sync_to_async(
+                lambda: IngredientFilter(
+                    request.GET, Ingredient.objects.all(), request=request
+                ).qs
+            )()
+            ingredients = [ingredient async for ingredient in queryset]
+            response = json_response(
+                IngredientSerializer(ingredients, many=True).data
+            )
+    return set_validators(response, etag)
+
+
+@async_api_view(download_shopping_cart_view)
+async def download_shopping_cart(request):
+    """Файл отдаётся асинхронным итератором: медленный клиент не
+    занимает поток."""
+    user = await authenticate(request)
+    file_format = request.GET.get('file_format', 'txt')
+    if user.is_anonymous or file_format not in SHOPPING_LIST_FORMATS:
+        return None
+    pages = ashopping_list_pages(
+        user, await sync_to_async(replica_for)(request, user)
+    )
+    return shopping_list_response(pages, file_format, asynchronous=True)
@@ -0,0 +1,169 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.db_router import primary
+
+'''Кэш ответов для анонимных пользователей.
+Для анонима is_favorited/is_in_shopping_cart всегда False, поэтому
+ответ зависит только от параметров запроса. Два уровня: локальная
+память процесса с коротким TTL и общий кэш (RESPONSE_CACHE_SHARED_ALIAS).
+Ключи содержат номера версий, которые хранятся в общем кэше; при записи
+версия увеличивается, и старые ключи перестают использоваться.'''
+
+LIST_VERSION_KEY = 'recipes:list:version'
+DETAIL_VERSION_KEY = 'recipes:detail:{}:version'
+# Названия и единицы ингредиентов встроены в любой рецепт.
+INGREDIENTS_VERSION_KEY = 'recipes:ingredients:version'
+
+
+def _local_cache():
+    return caches[settings.RESPONSE_CACHE_LOCAL_ALIAS]
+
+
+def _shared_cache():
+    return caches[settings.RESPONSE_CACHE_SHARED_ALIAS]
+
+
+def _initial_version():
+    # Версии входят в ETag: после потери ключа (рестарт, вытеснение)
+    # счёт начинается с текущего времени, а не с 1, и старый ETag не
+    # совпадёт с новым состоянием.
+    return time.time_ns()
+
+
+def get_version(key):
+    cache = _shared_cache()
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, timeout=None)
+        version = cache.get(key, initial)
+    return version
+
+
+def bump_version(key):
+    cache = _shared_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def invalidate_recipe(recipe_id=None):
+    bump_version(LIST_VERSION_KEY)
+    if recipe_id is not None:
+        bump_version(DETAIL_VERSION_KEY.format(recipe_id))
+
+
+def invalidate_ingredients():
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+def invalidate_author(author):
+    """Профиль автора встроен в каждый его рецепт."""
+    bump_version(LIST_VERSION_KEY)
+    for recipe_id in author.recipes.values_list('id', flat=True):
+        bump_version(DETAIL_VERSION_KEY.format(recipe_id))
+
+
+def _request_fingerprint(request):
+    # Хост входит в ключ: ссылки на картинки и страницы абсолютные.
+    params = sorted(request.GET.lists())
+    raw = f'{request.build_absolute_uri(request.path)}?{params}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_cache_key(request):
+    return 'recipes:list:{}:{}:{}'.format(
+        get_version(LIST_VERSION_KEY),
+        get_version(INGREDIENTS_VERSION_KEY),
+        _request_fingerprint(request)
+    )
+
+
+def detail_cache_key(request, pk):
+    return 'recipes:detail:{}:{}:{}'.format(
+        get_version(DETAIL_VERSION_KEY.format(pk)),
+        get_version(INGREDIENTS_VERSION_KEY),
+        _request_fingerprint(request)
+    )
+
+
+def get_cached_data(key):
+    local = _local_cache()
+    data = local.get(key)
+    if data is None:
+        data = _shared_cache().get(key)
+        if data is not None:
+            local.set(key, data, settings.RESPONSE_CACHE_LOCAL_TIMEOUT)
+    return data
+
+
+async def aget_cached_data(key):
+    local = _local_cache()
+    data = await local.aget(key)
+    if data is None:
+        data = await _shared_cache().aget(key)
+        if data is not None:
+            await local.aset(
+                key, data, settings.RESPONSE_CACHE_LOCAL_TIMEOUT
+            )
+    return data
+
+
+def set_cached_data(key, data):
+    _local_cache().set(key, data, settings.RESPONSE_CACHE_LOCAL_TIMEOUT)
+    _shared_cache().set(key, data, settings.RESPONSE_CACHE_SHARED_TIMEOUT)
+
+
+async def aset_cached_data(key, data):
+    await _local_cache().aset(
+        key, data, settings.RESPONSE_CACHE_LOCAL_TIMEOUT
+    )
+    await _shared_cache().aset(
+        key, data, settings.RESPONSE_CACHE_SHARED_TIMEOUT
+    )
+
+
+def get_cached_response(key, view):
+    """Ответ из кэша или view(), сохранённый в оба уровня."""
+    data = get_cached_data(key)
+    if data is not None:
+        return Response(data)
+    # Ответ живёт в кэше под новой версией: читаем не с реплики.
+    with primary():
+        response = view()
+    if response.status_code == status.HTTP_200_OK:
+        set_cached_data(key, response.data)
+    return response
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует list и retrieve для анонимных пользователей."""
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        return get_cached_response(
+            list_cache_key(request),
+            lambda: super(AnonymousResponseCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().retrieve(request, *args, **kwargs)
+        pk = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        return get_cached_response(
+            detail_cache_key(request, pk),
+            lambda: super(AnonymousResponseCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
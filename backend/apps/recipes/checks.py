@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+'''Проверки настроек при старте (manage.py check, runserver, migrate).'''
+
+# Хранят данные в памяти процесса: у каждого воркера свои версии.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии для ETag и кэша ответов должны быть общими для воркеров.
+
+    Иначе правка, обработанная одним воркером, не меняет ETag другого,
+    и тот отвечает 304 на устаревшие данные. В DEBUG (один процесс
+    runserver) не мешает.
+    """
+    if settings.DEBUG:
+        return []
+    backend = settings.CACHES[settings.RESPONSE_CACHE_SHARED_ALIAS]['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Условные GET (ETag) и кэш ответов используют кэш '
+        f'{settings.RESPONSE_CACHE_SHARED_ALIAS!r} ({backend}), который '
+        'у каждого процесса свой.',
+        hint='Задайте SHARED_CACHE_LOCATION (например, Redis) или '
+             'запускайте один процесс.',
+        id='recipes.W001',
+    )]
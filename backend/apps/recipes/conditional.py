@@ -0,0 +1,113 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from .cache import (
+    DETAIL_VERSION_KEY, INGREDIENTS_VERSION_KEY, LIST_VERSION_KEY,
+    get_version
+)
+from .pagination import USER_COUNT_VERSION_KEY
+
+'''Условные GET-запросы (ETag / Last-Modified).
+Вьюсет описывает состояние ресурса в get_validators() версиями из
+кэша или одним лёгким запросом; если клиент прислал совпадающий валидатор,
+отвечаем 304 без выборки и сериализации. Если валидаторов нет
+(get_validators вернул None), ETag считается по готовым данным ответа,
+например взятым из кэша.'''
+
+INGREDIENTS_TABLE = 'ingredient'
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def data_etag(data):
+    """ETag по готовым данным ответа."""
+    return make_etag(json.dumps(data, sort_keys=True, default=str))
+
+
+def recipe_validators(user, pk=None):
+    """Части ETag рецепта pk (None - списка) для пользователя user.
+
+    Только версии из кэша, без запросов к базе. Их увеличивают изменения
+    рецептов и авторов, ингредиентов, а также избранного, корзины и
+    подписок пользователя.
+    """
+    return (
+        get_version(
+            LIST_VERSION_KEY if pk is None
+            else DETAIL_VERSION_KEY.format(pk)
+        ),
+        get_version(INGREDIENTS_VERSION_KEY),
+        get_version(USER_COUNT_VERSION_KEY.format(user.pk)),
+    )
+
+
+def not_modified(request, etag, last_modified=None):
+    """Ответ 304/412, если валидаторы клиента совпали, иначе None."""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        # HTTP-даты с точностью до секунды.
+        last_modified=last_modified and int(last_modified.timestamp())
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified и ответ 304 для list и retrieve."""
+    def get_validators(self):
+        """(части ETag, Last-Modified) или None."""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def conditional_response(self, respond):
+        request = self.request
+        validators = self.get_validators()
+        if validators is None:
+            response = respond()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag = data_etag(response.data)
+            last_modified = None
+        else:
+            parts, last_modified = validators
+            etag = make_etag(
+                sorted(self.kwargs.items()),
+                sorted(request.query_params.lists()),
+                *parts
+            )
+            response = None
+
+        unchanged = not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            response = unchanged
+        elif response is None:
+            response = respond()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,269 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.users.models import Subscription
+from .models import Favorite, Recipe, ShoppingCart
+
+'''Счётчики популярности.
+У рецепта хранятся favorites_count и cart_count, у пользователя -
+recipes_count и followers_count. Они меняются на ±1 выражением F() в той
+же транзакции, что и связь, поэтому параллельные запросы не теряют
+прибавки и не требуют COUNT(*) при чтении. recipes_count ведут
+сигналы post_save/pre_delete рецепта (apps/recipes/signals.py), поэтому
+он верен на любом пути: API, админка, shell, удаление автора каскадом.
+Избранное, корзину и подписки считает API; их изменения в обход API
+(админка, shell, bulk_create) счётчики не трогают, для этого есть
+reconcile_counters (manage.py reconcile_counters).'''
+
+User = get_user_model()
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+# Связь -> (поле со связанным объектом, счётчик этого объекта).
+RELATION_COUNTERS = {
+    **{
+        model: ('recipe', field) for model, field in RECIPE_COUNTERS.items()
+    },
+    Subscription: ('author', 'followers_count'),
+}
+
+
+def _change(queryset, field, delta):
+    if delta:
+        queryset.update(**{field: F(field) + delta})
+
+
+def count_relations(model, recipe_ids, delta):
+    """Избранное/корзина: delta к счётчику рецептов recipe_ids."""
+    if not recipe_ids:
+        return
+    _change(
+        Recipe.objects.filter(pk__in=recipe_ids), RECIPE_COUNTERS[model],
+        delta
+    )
+
+
+def _relations_sql(model, connection, delta, returning):
+    """Запрос WITH: связи с объектами из списка и ±1 к их счётчикам.
+
+    INSERT ... ON CONFLICT DO NOTHING (или DELETE) возвращает только
+    строки, которые действительно изменились, и счётчик меняется ровно
+    у их объектов. UPDATE возвращает столбцы returning этих объектов.
+    """
+    quote = connection.ops.quote_name
+    target_name, counter = RELATION_COUNTERS[model]
+    target = model._meta.get_field(target_name)
+    counted = target.related_model
+    relation = quote(model._meta.db_table)
+    user_id = quote(model._meta.get_field('user').column)
+    target_id = quote(target.column)
+    table = quote(counted._meta.db_table)
+    pk = quote(counted._meta.pk.column)
+    field = quote(counted._meta.get_field(counter).column)
+    if delta > 0:
+        change = (
+            f'INSERT INTO {relation} ({user_id}, {target_id}) '
+            f'SELECT %s, {pk} FROM {table} WHERE {pk} = ANY(%s) '
+            f'ON CONFLICT DO NOTHING'
+        )
+    else:
+        change = (
+            f'DELETE FROM {relation} '
+            f'WHERE {user_id} = %s AND {target_id} = ANY(%s)'
+        )
+    return (
+        f'WITH changed AS ({change} RETURNING {target_id}) '
+        f'UPDATE {table} SET {field} = {field} {"+" if delta > 0 else "-"} 1 '
+        f'WHERE {pk} IN (SELECT {target_id} FROM changed) '
+        f'RETURNING {", ".join(quote(column) for column in returning)}'
+    )
+
+
+def _postgresql(model):
+    using = router.db_for_write(model)
+    connection = connections[using]
+    return using if connection.vendor == 'postgresql' else None
+
+
+def _change_relations(model, user, ids, delta):
+    """id объектов, связь user с которыми действительно изменилась.
+
+    На PostgreSQL - один запрос _relations_sql. Иначе (SQLite) текущие
+    связи читаются в той же транзакции, что и запись: SQLite блокирует
+    базу на запись целиком, и параллельная запись между чтением и нашей
+    записью невозможна (или наша запись упадёт с database is locked).
+    """
+    if not ids:
+        return set()
+    target, counter = RELATION_COUNTERS[model]
+    counted = model._meta.get_field(target).related_model
+    using = _postgresql(model)
+    if using is not None:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                _relations_sql(
+                    model, connections[using], delta,
+                    [counted._meta.pk.column]
+                ),
+                [user.pk, list(ids)]
+            )
+            return {pk for pk, in cursor.fetchall()}
+    with transaction.atomic():
+        relations = model.objects.filter(
+            user=user, **{f'{target}_id__in': ids}
+        )
+        present = set(relations.values_list(f'{target}_id', flat=True))
+        if delta > 0:
+            changed = set(counted.objects.filter(
+                pk__in=ids
+            ).exclude(pk__in=present).values_list('pk', flat=True))
+            model.objects.bulk_create(
+                model(user=user, **{f'{target}_id': pk}) for pk in changed
+            )
+        else:
+            changed = present
+            relations.delete()
+        _change(counted.objects.filter(pk__in=changed), counter, delta)
+    return changed
+
+
+def add_relations(model, user, ids):
+    """Связи user с объектами ids (для пакетов); см. _change_relations."""
+    return _change_relations(model, user, ids, 1)
+
+
+def remove_relations(model, user, ids):
+    return _change_relations(model, user, ids, -1)
+
+
+def create_relation(model, user, recipe_id):
+    """Избранное/корзина: связь и +1 к счётчику рецепта.
+
+    Возвращает рецепт или None, если рецепта нет или связь уже есть.
+    На PostgreSQL это один запрос (_relations_sql) без отдельной
+    транзакции; SQLite не умеет INSERT внутри WITH, там - SELECT,
+    INSERT и UPDATE.
+    """
+    recipe_id = Recipe._meta.pk.get_prep_value(recipe_id)
+    using = _postgresql(model)
+    try:
+        if using is not None:
+            # Рецепт, удалённый параллельно, даст IntegrityError по FK.
+            return next(iter(Recipe.objects.raw(
+                _relations_sql(
+                    model, connections[using], 1,
+                    [field.column for field in Recipe._meta.concrete_fields]
+                ),
+                [user.pk, [recipe_id]], using=using
+            )), None)
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None:
+            return None
+        with transaction.atomic():
+            model.objects.create(user=user, recipe=recipe)
+    except IntegrityError:
+        return None
+    count_relations(model, [recipe.pk], 1)
+    return recipe
+
+
+def count_recipes(author_id, delta):
+    _change(User.objects.filter(pk=author_id), 'recipes_count', delta)
+
+
+def count_followers(author_id, delta):
+    _change(User.objects.filter(pk=author_id), 'followers_count', delta)
+
+
+def release_user_counters(user):
+    """Вычитает связи пользователя перед его удалением."""
+    for model, field in RECIPE_COUNTERS.items():
+        _change(
+            Recipe.objects.filter(
+                pk__in=model.objects.filter(user=user).values('recipe_id')
+            ),
+            field, -1
+        )
+    _change(
+        User.objects.filter(
+            pk__in=Subscription.objects.filter(
+                user=user
+            ).values('author_id')
+        ),
+        'followers_count', -1
+    )
+
+
+def _count(queryset, field):
+    """Подзапрос COUNT(*) по связям объекта OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def _recounts(recipe_ids, user_ids):
+    """(выборка, {счётчик: подзапрос COUNT(*)}) для рецептов и
+    пользователей; None в ids - все записи."""
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    return (
+        (recipes, {
+            'favorites_count': _count(Favorite.objects.all(), 'recipe'),
+            'cart_count': _count(ShoppingCart.objects.all(), 'recipe'),
+        }),
+        (users, {
+            'recipes_count': _count(Recipe.objects.all(), 'author'),
+            'followers_count': _count(Subscription.objects.all(), 'author'),
+        }),
+    )
+
+
+@transaction.atomic
+def reconcile_counters(recipe_ids=None, user_ids=None):
+    """Пересчёт счётчиков по таблицам связей; None - все записи.
+
+    Один UPDATE на таблицу. Возвращает число обновлённых строк
+    рецептов и пользователей.
+    """
+    return tuple(
+        queryset.update(**counts)
+        for queryset, counts in _recounts(recipe_ids, user_ids)
+    )
+
+
+def counter_mismatches(recipe_ids=None, user_ids=None):
+    """Что исправил бы reconcile_counters, без записи.
+
+    Список (модель, pk, счётчик, сохранено, должно быть).
+    """
+    mismatches = []
+    for queryset, counts in _recounts(recipe_ids, user_ids):
+        expected = {
+            f'expected_{field}': count for field, count in counts.items()
+        }
+        for row in queryset.annotate(**expected).values(
+            'pk', *counts, *expected
+        ).order_by('pk'):
+            mismatches.extend(
+                (
+                    queryset.model._meta.label, row['pk'], field,
+                    row[field], row[f'expected_{field}']
+                )
+                for field in counts
+                if row[field] != row[f'expected_{field}']
+            )
+    return mismatches
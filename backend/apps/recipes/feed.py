@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from apps.users.models import Subscription
+from .models import FeedEntry, Recipe
+
+'''Лента рецептов авторов, на которых подписан пользователь.
+При публикации рецепт раскладывается по лентам подписчиков (FeedEntry),
+и лента читается диапазоном по индексу (user, -pub_date). Для авторов,
+у которых подписчиков больше FEED_FANOUT_THRESHOLD, раскладка не
+делается: их рецепты подмешиваются при чтении. При подписке в ленту
+добавляются FEED_BACKFILL_SIZE последних рецептов автора, при отписке
+записи автора удаляются.'''
+
+
+def popular_author_ids(subscriptions):
+    """Авторы из подписок, у которых слишком много подписчиков."""
+    return list(subscriptions.filter(
+        author__followers_count__gt=settings.FEED_FANOUT_THRESHOLD
+    ).values_list('author_id', flat=True))
+
+
+def fan_out_recipe(recipe):
+    """Записи в ленты подписчиков автора нового рецепта."""
+    follower_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)[:settings.FEED_FANOUT_THRESHOLD + 1])
+    if len(follower_ids) > settings.FEED_FANOUT_THRESHOLD:
+        return
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date
+            )
+            for user_id in follower_ids
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_feed(user, author):
+    """Последние рецепты автора в ленту нового подписчика."""
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user.pk,
+                recipe_id=recipe_id,
+                author_id=author.pk,
+                pub_date=pub_date
+            )
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author=author
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:settings.FEED_BACKFILL_SIZE]
+        ),
+        ignore_conflicts=True
+    )
+
+
+def remove_from_feed(user, author_id):
+    FeedEntry.objects.filter(user=user, author_id=author_id).delete()
+
+
+def rebuild_feeds(user_ids):
+    """Ленты пользователей заново: по FEED_BACKFILL_SIZE от каждого автора."""
+    followers = {}
+    for user_id, author_id in Subscription.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', 'author_id'):
+        followers.setdefault(author_id, []).append(user_id)
+    recipes = Recipe.objects.filter(
+        author_id__in=followers
+    ).latest_per_author(settings.FEED_BACKFILL_SIZE).values_list(
+        'id', 'author_id', 'pub_date'
+    )
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id__in=user_ids).delete()
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date
+                )
+                for recipe_id, author_id, pub_date in recipes
+                for user_id in followers[author_id]
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+def get_feed(user, recipes):
+    """Рецепты ленты (из queryset recipes) от новых к старым."""
+    popular = popular_author_ids(Subscription.objects.filter(user=user))
+    if not popular:
+        return recipes.filter(feed_entries__user=user).order_by(
+            '-feed_entries__pub_date', '-feed_entries__recipe'
+        )
+    return recipes.filter(
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=popular)
+    ).order_by('-pub_date', '-id')
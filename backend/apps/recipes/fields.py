@@ -1,27 +1,95 @@
-from django.core.files.base import ContentFile
+import binascii
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, UnidentifiedImageError
 
 from rest_framework import serializers
 import base64
 
 '''По требованиям яндекс практикума это поле должно быть.
 Сериализаторы
-При публикации рецепта фронтенд кодирует картинку в строку base64; 
-на бэкенде её необходимо декодировать и сохранить как файл. 
-Для этого будет удобно создать кастомный тип поля для картинки, 
+При публикации рецепта фронтенд кодирует картинку в строку base64;
+на бэкенде её необходимо декодировать и сохранить как файл.
+Для этого будет удобно создать кастомный тип поля для картинки,
 переопределив метод сериализатора to_internal_value.'''
 
+ALLOWED_IMAGE_FORMATS = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для работы с картинками в base64."""
+    """Поле для работы с картинками в base64.
+
+    Размер проверяется до декодирования, декодирование идёт кусками
+    (большие файлы уходят во временный файл на диске), а размеры
+    картинки читаются из заголовка до полной проверки Pillow.
+    """
     def to_internal_value(self, data):
         if not isinstance(data, str) or not data.startswith('data:image'):
             raise serializers.ValidationError('Неправильный формат картинки')
 
-        format, imgstr = data.split(';base64,')
-        ext = format.split('/')[-1]
+        try:
+            format, imgstr = data.split(';base64,')
+        except ValueError:
+            raise serializers.ValidationError('Неправильный формат картинки')
+        ext = format.split('/')[-1].lower()
+        if ext not in ALLOWED_IMAGE_FORMATS:
+            raise serializers.ValidationError(
+                f'Допустимые форматы: {", ".join(ALLOWED_IMAGE_FORMATS)}'
+            )
+
+        size = len(imgstr) * 3 // 4 - imgstr[-2:].count('=')
+        if size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(
+                'Размер картинки не должен превышать '
+                f'{settings.IMAGE_MAX_UPLOAD_SIZE // 1024 // 1024} МБ'
+            )
 
-        data = ContentFile(
-            base64.b64decode(imgstr),
-            name='temp.' + ext
+        data = File(self._decode(imgstr), name='temp.' + ext)
+        data.size = data.file.tell()
+        data.seek(0)
+        self._validate_dimensions(data)
+        return super().to_internal_value(data)
+
+    def _decode(self, imgstr):
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
         )
-        return super().to_internal_value(data) 
\ No newline at end of file
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    imgstr[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError('Некорректные данные base64')
+        return file
+
+    def _validate_dimensions(self, file):
+        limit = settings.IMAGE_MAX_DIMENSION
+        error = f'Картинка должна быть не больше {limit}x{limit} пикселей'
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            # Pillow отказывается открывать слишком большие картинки.
+            raise serializers.ValidationError(error)
+        except (UnidentifiedImageError, OSError):
+            # Сообщение об ошибке сформирует стандартная проверка ImageField.
+            width = height = 0
+        file.seek(0)
+        if width > limit or height > limit:
+            raise serializers.ValidationError(error)
+
+
+class ThumbnailField(serializers.ImageField):
+    """Миниатюра рецепта; пока она не готова - исходная картинка."""
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return instance.thumbnail or instance.image
@@ -1,33 +1,60 @@
+from django.conf import settings
 from django_filters import rest_framework as filters
 
 from .models import Recipe, Ingredient
+from .search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering'
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
 
+    # Фильтруем по аннотациям из Recipe.objects.with_user_flags(),
+    # чтобы не делать повторный JOIN по избранному и корзине.
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(in_favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(in_shopping_cart__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию, ингредиентам и описанию с ранжированием."""
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Самые популярные сначала (индекс recipe_popularity_idx)."""
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
+
     class Meta:
         model = Recipe
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ordering'
+        )
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
+
+    def filter_name(self, queryset, name, value):
+        # С INGREDIENT_INDEX_ENABLED сюда не доходит: такой поиск
+        # IngredientViewSet отдаёт из индекса (ingredient_index.py).
+        return queryset.filter(
+            name__istartswith=value
+        ).order_by('name')[:settings.INGREDIENT_SEARCH_LIMIT]
 
     class Meta:
         model = Ingredient
@@ -0,0 +1,109 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, features
+
+from .cache import invalidate_recipe
+from .models import Recipe
+
+'''Фоновая обработка картинок рецептов.
+После сохранения рецепта миниатюра (WebP, если Pillow его поддерживает)
+строится в пуле потоков, чтобы не держать воркер на время обработки.
+Пока миниатюры нет, сериализаторы отдают исходную картинку.
+Здесь же освобождение файлов: хранилище общее для одинаковых картинок,
+поэтому файл удаляется, только когда на него не осталось ссылок.'''
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+
+def _thumbnail_format():
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def make_thumbnail(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    image_name = recipe.image.name
+    with recipe.image.open('rb') as source, Image.open(source) as image:
+        image = image.convert('RGB')
+        image.thumbnail(settings.IMAGE_THUMBNAIL_SIZE)
+        buffer = io.BytesIO()
+        pil_format, ext = _thumbnail_format()
+        image.save(buffer, pil_format, quality=settings.IMAGE_QUALITY)
+    base_name = os.path.splitext(os.path.basename(image_name))[0]
+    name = recipe.thumbnail.field.generate_filename(
+        recipe, f'{base_name}.{ext}'
+    )
+    name = recipe.thumbnail.storage.save(name, ContentFile(buffer.getvalue()))
+    # Картинку могли заменить, пока строилась миниатюра.
+    if Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        thumbnail=name
+    ):
+        invalidate_recipe(recipe_id)
+    else:
+        release_file(name)
+
+
+def _run(recipe_id):
+    close_old_connections()
+    try:
+        make_thumbnail(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось построить миниатюру рецепта %s', recipe_id
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(recipe):
+    """Строит миниатюру после фиксации транзакции."""
+    recipe_id = recipe.pk
+    if settings.IMAGE_PIPELINE_EAGER:
+        transaction.on_commit(lambda: make_thumbnail(recipe_id))
+    else:
+        transaction.on_commit(lambda: _executor.submit(_run, recipe_id))
+
+
+def count_references(name):
+    """Сколько записей ссылается на файл (файлы общие, см. storage.py)."""
+    return (
+        Recipe.objects.filter(Q(image=name) | Q(thumbnail=name)).count()
+        + User.objects.filter(avatar=name).count()
+    )
+
+
+def release_file(name):
+    """Удаляет файл, если на него больше никто не ссылается.
+
+    Свежие файлы остаются (их могла переиспользовать незафиксированная
+    транзакция, см. storage.py) - такие удалит collect_media.
+    """
+    if name and not count_references(name):
+        default_storage.delete_stale(
+            name, settings.MEDIA_GRACE_MINUTES * 60
+        )
+
+
+def release_files_on_commit(*names):
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(
+            lambda: [release_file(name) for name in names]
+        )
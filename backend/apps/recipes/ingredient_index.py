@@ -0,0 +1,108 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from foodgram.db_router import primary
+from .cache import INGREDIENTS_VERSION_KEY, get_version
+from .conditional import INGREDIENTS_TABLE
+from .models import Ingredient, TableVersion
+
+'''Индекс для автодополнения ингредиентов.
+Строки (id, название, единица) хранятся в памяти процесса,
+отсортированные по названию в casefold, поиск по префиксу - бинарный
+(bisect), поэтому ответ на запрос с name собирается без базы.
+Индекс помнит версию таблицы ингредиентов (TableVersion, из неё же
+ETag IngredientViewSet), при которой построен. Свежесть проверяется по
+версии ингредиентов в общем кэше (её увеличивает любое изменение
+ингредиентов после фиксации) и не реже раза в
+INGREDIENT_INDEX_CHECK_INTERVAL секунд - по TableVersion в базе, на
+случай локального кэша или потерянного ключа.'''
+
+
+class IngredientSnapshot:
+    """Неизменяемое состояние индекса: тело ответа и его ETag (version)
+    берутся из одного снимка."""
+    def __init__(self, version, rows):
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[0]))
+        self.version = version
+        self.keys = [name.casefold() for _, name, _ in rows]
+        self.rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in rows
+        ]
+
+    def search(self, prefix, limit):
+        """Ингредиенты, названия которых начинаются с prefix, по имени."""
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while (
+            end < len(self.keys)
+            and end - start < limit
+            and self.keys[end].startswith(prefix)
+        ):
+            end += 1
+        return sorted(self.rows[start:end], key=lambda row: row['name'])
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Сброс индекса: следующий поиск построит его заново."""
+        self._snapshot = None
+        self._cache_version = None
+        self._checked_at = None
+
+    def _is_fresh(self, cache_version):
+        return (
+            self._snapshot is not None
+            and cache_version == self._cache_version
+            and time.monotonic() - self._checked_at
+            < settings.INGREDIENT_INDEX_CHECK_INTERVAL
+        )
+
+    def build(self, version=None):
+        # Версия читается до строк: изменение между запросами даст
+        # лишнюю перестройку, а не устаревший индекс.
+        with primary():
+            if version is None:
+                version = TableVersion.get_version(INGREDIENTS_TABLE)
+            rows = list(Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator())
+        self._snapshot = IngredientSnapshot(version, rows)
+        return self._snapshot
+
+    def warm_up(self):
+        """Построение при старте; без таблицы (до migrate) молча пропускаем."""
+        try:
+            self.snapshot()
+        except DatabaseError:
+            pass
+
+    def snapshot(self):
+        # Версия из кэша читается раньше базы: её увеличивают после
+        # фиксации, поэтому новая версия в кэше означает новую в базе.
+        cache_version = get_version(INGREDIENTS_VERSION_KEY)
+        if self._is_fresh(cache_version):
+            return self._snapshot
+        with self._lock:
+            if self._is_fresh(cache_version):
+                return self._snapshot
+            with primary():
+                version = TableVersion.get_version(INGREDIENTS_TABLE)
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self.build(version)
+            self._cache_version = cache_version
+            self._checked_at = time.monotonic()
+            return snapshot
+
+
+ingredient_index = IngredientIndex()
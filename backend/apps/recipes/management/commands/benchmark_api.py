@@ -0,0 +1,176 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+)
+from apps.users.models import Subscription
+
+User = get_user_model()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержки, пропускной способности и числа запросов к БД '
+        'для основных эндпоинтов API; результат в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов на сценарий'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Запросов на прогрев (не учитываются)'
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя; по умолчанию тот, у кого есть корзина'
+        )
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Запустить только указанные сценарии'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результата; по умолчанию stdout'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля')
+        user = self.get_user(options['user'])
+        scenarios = self.get_scenarios(user)
+        if options['scenario']:
+            unknown = set(options['scenario']) - set(scenarios)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+            scenarios = {
+                name: scenario for name, scenario in scenarios.items()
+                if name in options['scenario']
+            }
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        results = {}
+        for name, (urls, authenticated) in scenarios.items():
+            if self.verbosity > 1:
+                self.stderr.write(name)
+            results[name] = self.run(
+                clients[authenticated], urls,
+                options['requests'], options['warmup']
+            )
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'user': user.pk,
+            'requests': options['requests'],
+            'dataset': {
+                model._meta.label: model.objects.count()
+                for model in (
+                    User, Recipe, RecipeIngredient, Ingredient,
+                    Favorite, ShoppingCart, Subscription
+                )
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def get_user(self, user_id):
+        if user_id:
+            user = User.objects.filter(pk=user_id).first()
+        else:
+            user = User.objects.filter(
+                pk__in=ShoppingCart.objects.values('user_id')[:1]
+            ).first() or User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет данных: сначала выполните manage.py generate_data'
+            )
+        return user
+
+    def get_scenarios(self, user):
+        """{название: (список url по кругу, с авторизацией)}."""
+        recipe_ids = list(
+            Recipe.objects.order_by('?').values_list('id', flat=True)[:20]
+        )
+        author_id = Recipe.objects.values_list(
+            'author_id', flat=True
+        ).first()
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+        return {
+            'recipe_list_anonymous': (['/api/recipes/'], False),
+            'recipe_list': (['/api/recipes/'], True),
+            'recipe_detail': (
+                [f'/api/recipes/{pk}/' for pk in recipe_ids], True
+            ),
+            'filter_author': ([f'/api/recipes/?author={author_id}'], True),
+            'filter_is_favorited': (['/api/recipes/?is_favorited=1'], True),
+            'filter_is_in_shopping_cart': (
+                ['/api/recipes/?is_in_shopping_cart=1'], True
+            ),
+            'ingredient_search': (
+                [f'/api/ingredients/?name={(ingredient or "")[:3]}'], True
+            ),
+            'subscriptions': (
+                ['/api/users/subscriptions/?recipes_limit=3'], True
+            ),
+            'download_shopping_cart': (
+                ['/api/recipes/download_shopping_cart/'], True
+            ),
+        }
+
+    def request(self, client, url):
+        response = client.get(url)
+        # Потоковый ответ формируется только при чтении.
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+
+    def run(self, client, urls, count, warmup):
+        for i in range(warmup):
+            self.request(client, urls[i % len(urls)])
+        latencies = []
+        queries = []
+        started = time.perf_counter()
+        for i in range(count):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                self.request(client, urls[i % len(urls)])
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(context.captured_queries))
+        elapsed = time.perf_counter() - started
+        return {
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'throughput_rps': round(count / elapsed, 1),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+        }
@@ -0,0 +1,157 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from .benchmark_api import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/download_shopping_cart/',
+    '/api/ingredients/?name=сах',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузка на запущенный сервер с разным числом одновременных '
+        'клиентов: задержка, пропускная способность и ошибки в JSON. '
+        'Для сравнения gunicorn (foodgram.wsgi) и uvicorn (foodgram.asgi)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help='Адрес сервера'
+        )
+        parser.add_argument(
+            '--path', action='append',
+            help='Путь запроса (можно несколько, берутся по кругу)'
+        )
+        parser.add_argument(
+            '--concurrency', default='1,8,32,64',
+            help='Уровни одновременных клиентов через запятую'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов на уровень'
+        )
+        parser.add_argument(
+            '--token',
+            help='Токен для заголовка Authorization'
+        )
+        parser.add_argument(
+            '--slow-read', type=float, default=0,
+            help='Пауза (с) между чтениями кусков ответа: медленный клиент'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Таймаут одного запроса, с'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результата; по умолчанию stdout'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            levels = [
+                int(level) for level in options['concurrency'].split(',')
+            ]
+        except ValueError:
+            raise CommandError('--concurrency: числа через запятую')
+        if options['requests'] < 1 or min(levels) < 1:
+            raise CommandError(
+                '--requests и --concurrency должны быть больше нуля'
+            )
+        self.options = options
+        # urllib не кодирует кириллицу в пути (name=сах) сам.
+        self.urls = [
+            options['base_url'].rstrip('/') + quote(path, safe='/?=&')
+            for path in options['path'] or DEFAULT_PATHS
+        ]
+        self.headers = {}
+        if options['token']:
+            self.headers['Authorization'] = f'Token {options["token"]}'
+
+        results = {}
+        for level in levels:
+            if options['verbosity'] > 1:
+                self.stderr.write(f'concurrency={level}')
+            results[level] = self.run(level, options['requests'])
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'base_url': options['base_url'],
+            'paths': options['path'] or list(DEFAULT_PATHS),
+            'requests': options['requests'],
+            'slow_read': options['slow_read'],
+            'concurrency': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def request(self, url):
+        """Время запроса до последнего байта или None при ошибке."""
+        started = time.perf_counter()
+        try:
+            with urlopen(
+                Request(url, headers=self.headers),
+                timeout=self.options['timeout']
+            ) as response:
+                while response.read(16 * 1024):
+                    if self.options['slow_read']:
+                        time.sleep(self.options['slow_read'])
+        except Exception:
+            # Любая ошибка - это ошибка запроса, а не остановка клиента.
+            return None
+        return time.perf_counter() - started
+
+    def run(self, concurrency, count):
+        counter = iter(range(count))
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+
+        def client():
+            nonlocal errors
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                latency = self.request(self.urls[i % len(self.urls)])
+                with lock:
+                    if latency is None:
+                        errors += 1
+                    else:
+                        latencies.append(latency)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(client) for _ in range(concurrency)
+            ]
+        # Исключение в клиенте (ошибка самой команды) не теряется.
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+        if not latencies:
+            return {'errors': errors}
+        return {
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'errors': errors,
+        }
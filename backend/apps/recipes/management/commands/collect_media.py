@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from apps.recipes.models import Recipe
+
+User = get_user_model()
+
+MEDIA_DIRECTORIES = ('recipes', 'users')
+
+
+class Command(BaseCommand):
+    help = 'Удаление файлов медиа, на которые не ссылается ни одна запись'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=settings.MEDIA_GRACE_MINUTES,
+            help='Не трогать файлы моложе указанного возраста'
+        )
+
+    def get_referenced(self):
+        referenced = set()
+        for queryset in (
+            Recipe.objects.values_list('image', 'thumbnail'),
+            User.objects.exclude(avatar=None).values_list('avatar'),
+        ):
+            for names in queryset.iterator():
+                referenced.update(name for name in names if name)
+        return referenced
+
+    def walk(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for subdirectory in directories:
+            yield from self.walk(os.path.join(directory, subdirectory))
+
+    def handle(self, *args, **options):
+        referenced = self.get_referenced()
+        # Свежий файл может принадлежать ещё не зафиксированной транзакции.
+        deadline = time.time() - options['grace_minutes'] * 60
+        removed = freed = 0
+        for directory in MEDIA_DIRECTORIES:
+            if not default_storage.exists(directory):
+                continue
+            for name in self.walk(directory):
+                if name in referenced:
+                    continue
+                path = default_storage.path(name)
+                if os.path.getmtime(path) > deadline:
+                    continue
+                freed += os.path.getsize(path)
+                removed += 1
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed} ({freed // 1024} КБ)'
+        ))
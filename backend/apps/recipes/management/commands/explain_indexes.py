@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from apps.recipes.models import Recipe, RecipeIngredient, ShoppingListItem
+
+User = get_user_model()
+
+# Индексы из миграций 0008-0009, которые снимаются для плана «до».
+INDEXES = (
+    'recipe_pub_date_id_idx',
+    'recipe_author_pub_date_idx',
+    'recipeingredient_recipe_cover',
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Планы горячих запросов (EXPLAIN) с индексами и без них'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='id пользователя для фильтров; по умолчанию первый'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Сначала показать планы без индексов. Индексы удаляются '
+                 'в транзакции, которая затем откатывается; на время '
+                 'работы таблицы заблокированы'
+        )
+
+    def handle(self, *args, **options):
+        if options['analyze'] and connection.vendor != 'postgresql':
+            raise CommandError('--analyze поддерживается только в PostgreSQL')
+        user = (
+            User.objects.filter(pk=options['user']).first()
+            if options['user'] else User.objects.order_by('pk').first()
+        )
+        if user is None:
+            raise CommandError('Нет пользователей: сначала заполните базу')
+        self.explain_options = (
+            {'analyze': True, 'buffers': True} if options['analyze'] else {}
+        )
+        queries = self.get_queries(user)
+
+        if options['compare']:
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        for name in INDEXES:
+                            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+                    self.stdout.write(
+                        self.style.MIGRATE_HEADING('Без индексов')
+                    )
+                    self.print_plans(queries)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            # sqlite3 кэширует подготовленные запросы вместе с планом.
+            connection.close()
+        self.stdout.write(self.style.MIGRATE_HEADING('С индексами'))
+        self.print_plans(queries)
+
+    def get_queries(self, user):
+        author_id = Recipe.objects.values_list(
+            'author_id', flat=True
+        ).first() or user.pk
+        recipes = Recipe.objects.with_user_flags(user).order_by(
+            '-pub_date', '-id'
+        )
+        recipe_ids = list(recipes.values_list('id', flat=True)[:6])
+        return {
+            'Лента рецептов': recipes[:6],
+            'Рецепты автора': recipes.filter(author_id=author_id)[:6],
+            'Избранное': recipes.filter(is_favorited=True)[:6],
+            'Корзина': recipes.filter(is_in_shopping_cart=True)[:6],
+            'Ингредиенты страницы': RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'ingredient_id', 'amount'),
+            'Подписки': User.objects.filter(
+                following__user=user
+            ).order_by('-following__id')[:6],
+            'Скачивание списка покупок': ShoppingListItem.objects.filter(
+                user=user
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
+            ).order_by('ingredient__name'),
+            'Пересборка списка покупок': RecipeIngredient.objects.filter(
+                recipe__in_shopping_cart__user_id=user.pk
+            ).values_list('ingredient_id').annotate(
+                total_amount=Sum('amount')
+            ).order_by(),
+        }
+
+    def print_plans(self, queries):
+        for title, queryset in queries.items():
+            self.stdout.write(self.style.SUCCESS(title))
+            self.stdout.write(queryset.explain(**self.explain_options))
+            self.stdout.write('')
@@ -0,0 +1,196 @@
+import io
+import random
+import secrets
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from apps.recipes.cache import invalidate_ingredients, invalidate_recipe
+from apps.recipes.conditional import INGREDIENTS_TABLE
+from apps.recipes.counters import reconcile_counters
+from apps.recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    TableVersion
+)
+from apps.recipes.feed import rebuild_feeds
+from apps.recipes.pagination import invalidate_counts
+from apps.recipes.search import update_search_vectors
+from apps.recipes.shopping_list import rebuild_shopping_lists
+from apps.users.models import Subscription
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'Bench12345!'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у каждого пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине у каждого пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок у каждого пользователя'
+        )
+        parser.add_argument(
+            '--min-ingredients', type=int, default=500,
+            help='Сколько ингредиентов создать, если справочник меньше'
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--seed', type=int,
+            help='Зерно генератора для воспроизводимых данных'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Уникальная метка запуска: данные можно догенерировать повторно.
+        self.run = secrets.token_hex(3)
+        started = time.monotonic()
+
+        ingredient_ids = self.ensure_ingredients(options['min_ingredients'])
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        self.create_recipe_ingredients(
+            recipe_ids, ingredient_ids, options['ingredients_per_recipe']
+        )
+        self.create_links(
+            Favorite, 'recipe_id', user_ids, recipe_ids, options['favorites']
+        )
+        self.create_links(
+            ShoppingCart, 'recipe_id', user_ids, recipe_ids, options['cart']
+        )
+        self.create_links(
+            Subscription, 'author_id', user_ids, user_ids,
+            options['subscriptions']
+        )
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            rebuild_shopping_lists(batch)
+            rebuild_feeds(batch)
+        update_search_vectors(recipe_ids)
+        reconcile_counters(recipe_ids, user_ids)
+
+        invalidate_recipe()
+        invalidate_counts(Recipe)
+        invalidate_counts(User)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {len(user_ids)} пользователей и {len(recipe_ids)} '
+            f'рецептов за {time.monotonic() - started:.1f} с '
+            f'(пароль пользователей: {BENCH_PASSWORD})'
+        ))
+
+    def bulk_create(self, model, objects):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size],
+                ignore_conflicts=True
+            )
+
+    def ensure_ingredients(self, minimum):
+        missing = minimum - Ingredient.objects.count()
+        if missing > 0:
+            self.bulk_create(Ingredient, [
+                Ingredient(
+                    name=f'Ингредиент {self.run}-{i}',
+                    measurement_unit=self.random.choice(UNITS)
+                )
+                for i in range(missing)
+            ])
+            TableVersion.bump(INGREDIENTS_TABLE)
+            invalidate_ingredients()
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        # Хэш пароля считается один раз: PBKDF2 на каждого - это минуты.
+        password = make_password(BENCH_PASSWORD)
+        prefix = f'bench_{self.run}_'
+        self.bulk_create(User, [
+            User(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                first_name='Тест',
+                last_name=f'Пользователь {i}',
+                password=password
+            )
+            for i in range(count)
+        ])
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('id', flat=True))
+
+    def create_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+        # Хранилище адресуется по содержимому: файл один на все рецепты.
+        return default_storage.save(
+            'recipes/bench.png', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(self, count, user_ids):
+        if not user_ids:
+            return []
+        image = self.create_image()
+        name = f'Рецепт {self.run}'
+        self.bulk_create(Recipe, [
+            Recipe(
+                name=f'{name}-{i}',
+                text='Синтетический рецепт для замеров производительности.',
+                cooking_time=self.random.randint(5, 180),
+                image=image,
+                author_id=self.random.choice(user_ids)
+            )
+            for i in range(count)
+        ])
+        return list(Recipe.objects.filter(
+            name__startswith=name
+        ).values_list('id', flat=True))
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids, count):
+        count = min(count, len(ingredient_ids))
+        self.bulk_create(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(ingredient_ids, count)
+        ])
+
+    def create_links(self, model, target, user_ids, target_ids, count):
+        """Случайные связи пользователь - рецепт/автор без повторов."""
+        objects = []
+        for user_id in user_ids:
+            # Один запасной кандидат: на себя подписаться нельзя.
+            candidates = [
+                target_id for target_id in self.random.sample(
+                    target_ids, min(count + 1, len(target_ids))
+                )
+                if not (model is Subscription and target_id == user_id)
+            ]
+            objects.extend(
+                model(user_id=user_id, **{target: target_id})
+                for target_id in candidates[:count]
+            )
+        self.bulk_create(model, objects)
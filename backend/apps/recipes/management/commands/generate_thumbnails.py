@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.images import make_thumbnail
+from apps.recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение миниатюр для рецептов, у которых их ещё нет'
+
+    def handle(self, *args, **options):
+        recipe_ids = Recipe.objects.filter(thumbnail='').exclude(
+            image=''
+        ).values_list('id', flat=True)
+        count = 0
+        for recipe_id in recipe_ids.iterator():
+            make_thumbnail(recipe_id)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Построено миниатюр: {count}')
+        )
@@ -0,0 +1,156 @@
+import random
+import threading
+from collections import Counter
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.recipes.counters import counter_mismatches
+from apps.recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, ShoppingListItem
+)
+from apps.recipes.shopping_list import calculate_shopping_lists
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Параллельные POST/DELETE к favorite, shopping_cart и subscribe '
+        'и пакетные запросы favorite/batch и shopping_cart/batch из '
+        'многих потоков: проверка, что переключатели не дают 500 и не '
+        'портят список покупок и счётчики. Пользователей, рецепт и ингредиент '
+        'команда создаёт сама и удаляет после проверки. Запускать на '
+        'PostgreSQL: SQLite не допускает параллельной записи'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument(
+            '--rounds', type=int, default=50,
+            help='Запросов на поток'
+        )
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING(
+                'SQLite блокирует базу на запись: ошибки «database is '
+                'locked» ожидаемы'
+            ))
+        user, author, recipe, ingredient = self.create_fixtures()
+        try:
+            self.hammer(options, user, author, recipe)
+        finally:
+            # Рецепт удаляется каскадом вместе с автором.
+            User.objects.filter(pk__in=[user.pk, author.pk]).delete()
+            ingredient.delete()
+
+    def create_fixtures(self):
+        suffix = uuid4().hex[:12]
+        user, author = (
+            User.objects.create_user(
+                email=f'{role}-{suffix}@example.com',
+                username=f'{role}-{suffix}',
+                first_name='hammer_toggles', last_name='hammer_toggles'
+            )
+            for role in ('hammer', 'hammer-author')
+        )
+        ingredient = Ingredient.objects.create(
+            name=f'hammer_toggles {suffix}', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name=f'hammer_toggles {suffix}',
+            text='hammer_toggles', cooking_time=1, image='recipes/hammer.png'
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=1
+        )
+        return user, author, recipe, ingredient
+
+    def hammer(self, options, user, author, recipe):
+        token = Token.objects.create(user=user)
+        # (метод, путь, тело запроса)
+        actions = [
+            (method, url, None)
+            for url in (
+                f'/api/recipes/{recipe.pk}/favorite/',
+                f'/api/recipes/{recipe.pk}/shopping_cart/',
+                f'/api/users/{author.pk}/subscribe/',
+            )
+            for method in ('post', 'delete')
+        ] + [
+            ('post', f'/api/recipes/{kind}/batch/', {key: [recipe.pk]})
+            for kind in ('favorite', 'shopping_cart')
+            for key in ('add', 'remove')
+        ]
+
+        results = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            barrier.wait()
+            try:
+                for _ in range(options['rounds']):
+                    method, url, data = rng.choice(actions)
+                    status = getattr(client, method)(
+                        url, data, format='json'
+                    ).status_code
+                    if data is not None:
+                        url = f'{url} {next(iter(data))}'
+                    with lock:
+                        results[url, method.upper(), status] += 1
+            finally:
+                connection.close()
+
+        seed = options['seed']
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(None if seed is None else seed + i,)
+            )
+            for i in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for (url, method, status), count in sorted(results.items()):
+            self.stdout.write(f'{method:6} {url} {status}: {count}')
+        errors = sum(
+            count for (_, _, status), count in results.items()
+            if status >= 500
+        )
+        expected = calculate_shopping_lists([user.pk])
+        stored = {
+            (user.pk, ingredient_id): total_amount
+            for ingredient_id, total_amount
+            in ShoppingListItem.objects.filter(user=user).values_list(
+                'ingredient_id', 'total_amount'
+            )
+        }
+        if stored != expected:
+            raise CommandError(
+                'Список покупок разошёлся с корзиной: '
+                f'сохранено {stored}, должно быть {expected}'
+            )
+        mismatches = counter_mismatches([recipe.pk], [user.pk, author.pk])
+        if mismatches:
+            raise CommandError(
+                'Счётчики разошлись со связями (модель, id, счётчик, '
+                f'сохранено, должно быть): {mismatches}'
+            )
+        if errors:
+            raise CommandError(f'Ответов 5xx: {errors}')
+        self.stdout.write(self.style.SUCCESS(
+            'Ошибок нет, список покупок и счётчики совпадают со связями'
+        ))
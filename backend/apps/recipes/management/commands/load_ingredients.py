@@ -1,57 +1,152 @@
+import csv
 import json
 import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from foodgram import settings
-from apps.recipes.models import Ingredient
+from apps.recipes.cache import invalidate_ingredients
+from apps.recipes.conditional import INGREDIENTS_TABLE
+from apps.recipes.models import Ingredient, TableVersion
+
+READ_CHUNK_SIZE = 64 * 1024
+CSV_HEADER = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row or tuple(row[:2]) == CSV_HEADER:
+            continue
+        yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            item = json.loads(line)
+            yield item['name'], item['measurement_unit']
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива: в памяти только текущий кусок."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position >= len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                # Объект не поместился в кусок - дочитываем файл.
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk or (position < len(buffer) and buffer[position] == ']'):
+            return
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'jsonl': read_ndjson,
+}
 
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из json'
+    help = 'Загрузка ингредиентов из csv, json или ndjson'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--path',
             type=str,
-            help='Путь к файлу JSON с ингредиентами',
+            help='Путь к файлу с ингредиентами',
             default='data/ingredients.json'
         )
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Размер пачки для bulk_create'
+        )
 
     def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        )
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+
         try:
-            path = options['path']
-            with open(path, encoding='utf-8') as f:
-                data = json.load(f)
-                
-                existing_ingredients = set(
-                    Ingredient.objects.values_list('name', 'measurement_unit')
+            with open(path, encoding='utf-8', newline='') as file:
+                total, created, elapsed = self.load(
+                    READERS[file_format](file), options['batch_size']
                 )
-                
-                new_ingredients = []
-                for item in data:
-                    ingredient_tuple = (item['name'], item['measurement_unit'])
-                    if ingredient_tuple not in existing_ingredients:
-                        new_ingredients.append(
-                            Ingredient(
-                                name=item['name'],
-                                measurement_unit=item['measurement_unit']
-                            )
-                        )
-                
-                if new_ingredients:
-                    Ingredient.objects.bulk_create(new_ingredients)
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Успешно добавлено {len(new_ingredients)} новых ингредиентов'
-                        )
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.SUCCESS('Все ингредиенты уже существуют в базе')
-                    )
-                    
         except FileNotFoundError:
             self.stdout.write(
-                self.style.ERROR(f'Файл ingredients.json не найден в папке {path}')
-            ) 
\ No newline at end of file
+                self.style.ERROR(f'Файл {path} не найден')
+            )
+            return
+        except (ValueError, KeyError, IndexError) as error:
+            raise CommandError(f'Некорректные данные в {path}: {error}')
+
+        if created:
+            TableVersion.bump(INGREDIENTS_TABLE)
+            invalidate_ingredients()
+            self.stdout.write(self.style.SUCCESS(
+                f'Успешно добавлено {created} новых ингредиентов'
+            ))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS('Все ингредиенты уже существуют в базе')
+            )
+        self.stdout.write(
+            f'Обработано {total} строк за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def load(self, rows, batch_size):
+        """Пачки по batch_size; дубликаты отсекает unique_ingredient."""
+        before = Ingredient.objects.count()
+        started = time.monotonic()
+        total = 0
+        while True:
+            batch = [
+                Ingredient(name=name.strip(), measurement_unit=unit.strip())
+                for name, unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            if self.verbosity > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{total} строк, {total / max(elapsed, 1e-6):.0f} строк/с'
+                )
+        elapsed = time.monotonic() - started
+        return total, Ingredient.objects.count() - before, elapsed
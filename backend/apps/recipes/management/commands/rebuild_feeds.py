@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.feed import rebuild_feeds
+from apps.users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок (FeedEntry) из подписок и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей обрабатывать за раз'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = sorted(set(
+            Subscription.objects.values_list('user_id', flat=True)
+        ))
+        batch_size = options['batch_size']
+        for start in range(0, len(user_ids), batch_size):
+            rebuild_feeds(user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны для {len(user_ids)} пользователей'
+        ))
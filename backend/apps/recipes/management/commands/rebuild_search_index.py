@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт поисковых векторов всех рецептов (PostgreSQL)'
+
+    def handle(self, *args, **options):
+        update_search_vectors()
+        self.stdout.write(self.style.SUCCESS('Поисковые векторы обновлены'))
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.models import ShoppingCart, ShoppingListItem
+from apps.recipes.shopping_list import (
+    calculate_shopping_lists, rebuild_shopping_lists
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересборка или проверка предрасчитанных списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые суммы с корзинами'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей обрабатывать за раз'
+        )
+
+    def get_user_ids(self):
+        return sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True))
+            | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+        )
+
+    def handle(self, *args, **options):
+        user_ids = self.get_user_ids()
+        batch_size = options['batch_size']
+        mismatched = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            if options['verify']:
+                mismatched += self.verify(batch)
+            else:
+                rebuild_shopping_lists(batch)
+
+        if not options['verify']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересобраны для {len(user_ids)} '
+                f'пользователей'
+            ))
+        elif mismatched:
+            self.stdout.write(self.style.ERROR(
+                f'Расхождений: {mismatched}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+
+    def verify(self, user_ids):
+        expected = calculate_shopping_lists(user_ids)
+        stored = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'ingredient_id', 'total_amount')
+        }
+        mismatched = 0
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatched += 1
+                self.stdout.write(
+                    f'user={key[0]} ingredient={key[1]}: '
+                    f'сохранено {stored.get(key)}, '
+                    f'должно быть {expected.get(key)}'
+                )
+        return mismatched
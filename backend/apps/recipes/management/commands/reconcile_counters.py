@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from apps.recipes.cache import invalidate_recipe
+from apps.recipes.counters import counter_mismatches, reconcile_counters
+from apps.recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков популярности (favorites_count, cart_count, '
+        'recipes_count, followers_count) по таблицам связей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Сколько строк обновлять в одной транзакции'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            mismatches = counter_mismatches()
+            for label, pk, field, stored, expected in mismatches:
+                self.stdout.write(
+                    f'{label} {pk} {field}: {stored} -> {expected}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Расхождений: {len(mismatches)}'
+            ))
+            return
+        batch_size = options['batch_size']
+        recipes = users = 0
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(recipe_ids), batch_size):
+            recipes += reconcile_counters(
+                recipe_ids=recipe_ids[start:start + batch_size], user_ids=[]
+            )[0]
+        user_ids = list(
+            User.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(user_ids), batch_size):
+            users += reconcile_counters(
+                recipe_ids=[], user_ids=user_ids[start:start + batch_size]
+            )[1]
+        invalidate_recipe()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users}'
+        ))
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:14
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Индексы только для PostgreSQL: UPPER(name::text) text_pattern_ops
+# обслуживает istartswith, триграммы - поиск по подстроке.
+INDEXES = (
+    (
+        'recipes_ingredient_name_upper_like',
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+        'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)',
+    ),
+    (
+        'recipes_ingredient_name_trgm',
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
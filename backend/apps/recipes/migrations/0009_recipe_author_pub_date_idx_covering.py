@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+# Покрывающий индекс только для PostgreSQL (INCLUDE): ингредиенты
+# рецептов и суммы для списка покупок читаются без обращения к таблице.
+# Индексы (user, recipe) для Favorite/ShoppingCart и (user, author)
+# для Subscription уже дают уникальные ограничения.
+INDEXES = (
+    (
+        'recipeingredient_recipe_cover',
+        'CREATE INDEX IF NOT EXISTS recipeingredient_recipe_cover '
+        'ON recipes_recipeingredient (recipe_id, ingredient_id) '
+        'INCLUDE (amount)',
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
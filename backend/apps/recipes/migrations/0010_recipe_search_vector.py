@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:25
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# GIN-индекс и начальное заполнение только для PostgreSQL; на других
+# базах поиск идёт по индексу в памяти (apps/recipes/search.py).
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)'
+)
+FILL_VECTORS = '''
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig,
+                              coalesce(recipe.name, '')), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_recipeingredient AS item
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = item.ingredient_id
+            WHERE item.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig,
+                                 coalesce(recipe.text, '')), 'C')
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(FILL_VECTORS, {'config': settings.SEARCH_CONFIG})
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_pub_date_idx_covering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
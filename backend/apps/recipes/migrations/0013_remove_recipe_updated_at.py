@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='updated_at',
+        ),
+    ]
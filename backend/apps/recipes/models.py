@@ -1,7 +1,12 @@
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 
+from apps.users.models import CountersMixin
+
 User = get_user_model()
 
 MAX_LENGTH_NAME = 200
@@ -9,7 +14,51 @@ MAX_LENGTH_MEASUREMENT = 200
 MIN_COOKING_TIME = 1
 MIN_AMOUNT = 1
 
-class Recipe(models.Model):
+
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Флаги is_favorited/is_in_shopping_cart одним запросом."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            )
+        )
+
+    def for_read(self, user):
+        """Всё для RecipeReadSerializer за постоянное число запросов."""
+        return self.with_user_flags(user).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            ),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
+    def latest_per_author(self, limit=None):
+        """Не больше limit свежих рецептов каждого автора (оконная функция)."""
+        if limit is None:
+            return self
+        return self.annotate(
+            author_row=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).filter(author_row__lte=limit)
+
+
+class Recipe(CountersMixin, models.Model):
     name = models.CharField(
         max_length=MAX_LENGTH_NAME,
         verbose_name='Название рецепта'
@@ -23,8 +72,15 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        db_index=True,
         verbose_name='Изображение рецепта'
     )
+    thumbnail = models.ImageField(
+        upload_to='recipes/thumbnails/',
+        blank=True,
+        db_index=True,
+        verbose_name='Миниатюра'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -35,9 +91,47 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    # Заполняется apps.recipes.search.update_search_vectors (PostgreSQL).
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    # Счётчики меняет apps.recipes.counters.
+    favorites_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    cart_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах'
+    )
+
+    COUNTER_FIELDS = ('favorites_count', 'cart_count')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # Ключ курсорной пагинации ленты рецептов.
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            # Рецепты автора (фильтр author, подписки) в порядке ленты.
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            # Сортировка по популярности (?ordering=popular).
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popularity_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -144,4 +238,117 @@ class ShoppingCart(models.Model):
             )
         ]
         verbose_name = 'Список покупок'
-        verbose_name_plural = 'Списки покупок' 
\ No newline at end of file
+        verbose_name_plural = 'Списки покупок' 
+
+class ShoppingListItem(models.Model):
+    """Предрасчитанная сумма ингредиента по корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика автора (fan-out при публикации)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    # Копия Recipe.pub_date: лента читается по одному индексу.
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class TableVersion(models.Model):
+    """Счётчик изменений таблицы для валидаторов HTTP-кэша (ETag)."""
+    name = models.CharField(
+        max_length=MAX_LENGTH_NAME,
+        unique=True,
+        verbose_name='Таблица'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+    @classmethod
+    def get_version(cls, name):
+        return cls.objects.filter(name=name).values_list(
+            'version', flat=True
+        ).first() or 0
+
+    @classmethod
+    async def aget_version(cls, name):
+        return await cls.objects.filter(name=name).values_list(
+            'version', flat=True
+        ).afirst() or 0
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(
+            version=models.F('version') + 1
+        ):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
@@ -1,6 +1,157 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from foodgram.db_router import primary
+
+from .cache import _shared_cache, bump_version, get_version
+
+'''Число записей для пагинации.
+COUNT(*) кэшируется по тексту запроса. В ключ входят версии модели
+и пользователя: версия модели растёт при создании/удалении записей,
+версия пользователя - при изменении его избранного, корзины и подписок,
+от которых зависят фильтры. На больших выборках (от
+PAGINATION_ESTIMATE_THRESHOLD строк по оценке планировщика PostgreSQL)
+точный подсчёт заменяется оценкой.'''
+
+MODEL_COUNT_VERSION_KEY = 'count:{}:version'
+USER_COUNT_VERSION_KEY = 'count:user:{}:version'
+
+
+def invalidate_counts(model=None, user=None):
+    if model is not None:
+        bump_version(MODEL_COUNT_VERSION_KEY.format(model._meta.label))
+    if user is not None:
+        bump_version(USER_COUNT_VERSION_KEY.format(user.id))
+
+
+def estimate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL или None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(queryset, user=None):
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        # Например, filter(id__in=[]): запрос заведомо пустой.
+        return 0
+    label = queryset.model._meta.label
+    key = 'count:{}:{}:{}'.format(
+        get_version(MODEL_COUNT_VERSION_KEY.format(label)),
+        get_version(USER_COUNT_VERSION_KEY.format(user.id))
+        if user is not None and user.is_authenticated else 0,
+        hashlib.md5(sql.encode()).hexdigest()
+    )
+    cache = _shared_cache()
+    count = cache.get(key)
+    if count is None:
+        with primary():
+            count = estimate_count(queryset)
+            if (
+                count is None
+                or count < settings.PAGINATION_ESTIMATE_THRESHOLD
+            ):
+                count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CountProviderPaginator(Paginator):
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        return get_count(self.object_list, self.user)
+
 
 class RecipePagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
-    max_page_size = 50 
\ No newline at end of file
+    max_page_size = 50
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountProviderPaginator(
+            object_list, per_page, user=self.request.user
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset-пагинация по (pub_date, id): без OFFSET и COUNT(*).
+
+    Общее число записей считается только по запросу ?count=true.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    ordering = ('-pub_date', '-id')
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+            '1', 'true', 'True'
+        ):
+            self.count = get_count(queryset, request.user)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
+
+
+class SubscriptionCursorPagination(RecipeCursorPagination):
+    ordering = ('-subscription_id',)
+
+
+def use_cursor_pagination(request):
+    return (
+        request.query_params.get('pagination') == 'cursor'
+        or 'cursor' in request.query_params
+    )
+
+
+class OptionalCursorPaginationMixin:
+    """Курсорная пагинация вместо постраничной по ?pagination=cursor.
+
+    Курсор идёт по дате, поэтому поиск (порядок по релевантности) и
+    ?ordering=popular всегда листаются по страницам.
+    """
+    cursor_pagination_class = RecipeCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if (
+                not use_cursor_pagination(self.request)
+                or 'search' in self.request.query_params
+                or 'ordering' in self.request.query_params
+            ):
+                return super().paginator
+            self._paginator = self.cursor_pagination_class()
+        return self._paginator
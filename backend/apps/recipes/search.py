@@ -0,0 +1,202 @@
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, When
+
+from foodgram.db_router import primary
+from .cache import LIST_VERSION_KEY, _shared_cache, get_version
+from .conditional import INGREDIENTS_TABLE
+from .models import Recipe, RecipeIngredient, TableVersion
+
+'''Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+В PostgreSQL у рецепта хранится search_vector (веса A/B/C), который
+обновляет update_search_vectors, поиск идёт по GIN-индексу с ранжированием
+ts_rank. На других базах (SQLite в разработке) используется обратный
+индекс в памяти процесса с теми же весами. Ранжированный список id
+кэшируется по версиям списка рецептов и таблицы ингредиентов (их
+названия входят в поиск), поэтому листание страниц не пересчитывает
+релевантность.'''
+
+TOKEN = re.compile(r'\w+')
+# Веса полей в обратном индексе, как A/B/C в search_vector.
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+
+def _is_postgresql():
+    return connections[Recipe.objects.db].vendor == 'postgresql'
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+def update_search_vectors(recipe_ids=None):
+    """Пересчёт search_vector (PostgreSQL); None - все рецепты."""
+    recipe_search.invalidate()
+    if not _is_postgresql():
+        return
+    config = settings.SEARCH_CONFIG
+    ingredient_names = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(Subquery(ingredient_names), weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    ))
+
+
+class RecipeSearchIndex:
+    """Обратный индекс: слово -> {id рецепта: вес}."""
+    def __init__(self):
+        self._words = []
+        self._postings = {}
+        self._built_at = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, version):
+        # Ингредиенты могли переименовать в другом процессе.
+        return (
+            self._built_at is not None
+            and version == self._version
+            and time.monotonic() - self._built_at
+            < settings.SEARCH_INDEX_TTL
+        )
+
+    def build(self, version=None):
+        postings = defaultdict(dict)
+
+        def add(recipe_id, text, weight):
+            for word in tokenize(text):
+                if postings[word].get(recipe_id, 0) < weight:
+                    postings[word][recipe_id] = weight
+
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            add(recipe_id, name, NAME_WEIGHT)
+            add(recipe_id, text, TEXT_WEIGHT)
+        for recipe_id, name in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            add(recipe_id, name, INGREDIENT_WEIGHT)
+        with self._lock:
+            self._postings = dict(postings)
+            self._words = sorted(postings)
+            self._built_at = time.monotonic()
+            self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _matches(self, term):
+        """Рецепты со словом, начинающимся на term: {id: вес}."""
+        with self._lock:
+            words, postings = self._words, self._postings
+        found = {}
+        position = bisect_left(words, term)
+        while position < len(words) and words[position].startswith(term):
+            for recipe_id, weight in postings[words[position]].items():
+                if found.get(recipe_id, 0) < weight:
+                    found[recipe_id] = weight
+            position += 1
+        return found
+
+    def search(self, query, limit, version=None):
+        """id рецептов, содержащих все слова запроса, по убыванию веса.
+
+        version - версия таблицы ингредиентов, при которой строится индекс.
+        """
+        if not self._is_fresh(version):
+            self.build(version)
+        scores = None
+        for term in tokenize(query):
+            matches = self._matches(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {
+                    recipe_id: score + matches[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in matches
+                }
+        if not scores:
+            return []
+        # При равном весе - более новые (больший id) выше.
+        return sorted(
+            scores, key=lambda recipe_id: (-scores[recipe_id], -recipe_id)
+        )[:limit]
+
+
+recipe_search = RecipeSearchIndex()
+
+
+def _rank_in_database(query, limit):
+    search_query = SearchQuery(
+        query, search_type='websearch', config=settings.SEARCH_CONFIG
+    )
+    return list(Recipe.objects.filter(
+        search_vector=search_query
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-pub_date', '-id').values_list(
+        'id', flat=True
+    )[:limit])
+
+
+def ranked_recipe_ids(query):
+    """Id найденных рецептов по убыванию релевантности (из кэша)."""
+    query = ' '.join(query.split())
+    if not query:
+        return []
+    with primary():
+        ingredients_version = TableVersion.get_version(INGREDIENTS_TABLE)
+    key = 'search:{}:{}:{}'.format(
+        get_version(LIST_VERSION_KEY),
+        ingredients_version,
+        hashlib.md5(query.casefold().encode()).hexdigest()
+    )
+    cache = _shared_cache()
+    ids = cache.get(key)
+    if ids is None:
+        limit = settings.SEARCH_MAX_RESULTS
+        with primary():
+            if _is_postgresql():
+                ids = _rank_in_database(query, limit)
+            else:
+                ids = recipe_search.search(
+                    query, limit, ingredients_version
+                )
+        cache.set(key, ids, settings.SEARCH_CACHE_TIMEOUT)
+    return ids
+
+
+def search_recipes(queryset, query):
+    """Фильтр по найденным id с сохранением порядка релевантности."""
+    ids = ranked_recipe_ids(query)
+    return queryset.filter(id__in=ids).annotate(
+        search_position=Case(
+            *(When(id=recipe_id, then=position)
+              for position, recipe_id in enumerate(ids)),
+            output_field=IntegerField()
+        )
+    ).order_by('search_position')
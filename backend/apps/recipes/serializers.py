@@ -1,8 +1,13 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.db import transaction
 from apps.recipes.models import Recipe, Ingredient, RecipeIngredient
 from apps.users.serializers import UserSerializer
-from apps.recipes.fields import Base64ImageField
+from apps.recipes.fields import Base64ImageField, ThumbnailField
+from apps.recipes.images import release_files_on_commit, schedule_thumbnail
+from apps.recipes.search import update_search_vectors
+from apps.recipes.shopping_list import change_recipe_amounts
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -17,13 +22,6 @@ class RecipeIngredientCreateSerializer(serializers.Serializer):
         validators=[MinValueValidator(1)]
     )
 
-    def validate_id(self, ingredient_id):
-        if not Ingredient.objects.filter(id=ingredient_id).exists():
-            raise serializers.ValidationError(
-                f'Ингредиент с id={ingredient_id} не найден.'
-            )
-        return ingredient_id
-
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
@@ -50,22 +48,29 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnail = ThumbnailField()
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'author', 'name', 'image', 'text',
+            'id', 'author', 'name', 'image', 'thumbnail', 'text',
             'ingredients', 'cooking_time',
             'is_favorited', 'is_in_shopping_cart'
         )
 
+    # Флаги обычно приходят аннотацией из Recipe.objects.for_read(),
+    # запрос делаем только для объектов, загруженных в обход неё.
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return obj.in_favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -100,21 +105,84 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 )
             ingredient_ids.append(ingredient_id)
 
+        # Все id проверяются одним запросом.
+        found = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        missing = [str(pk) for pk in ingredient_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты с id={", ".join(missing)} не найдены.'
+            )
         return data
 
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         recipe = super().create(validated_data)
         self._create_ingredients(ingredients, recipe)
+        update_search_vectors([recipe.pk])
+        schedule_thumbnail(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        instance.recipe_ingredients.all().delete()
-        self._create_ingredients(ingredients, instance)
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            # Старая миниатюра больше не соответствует картинке.
+            release_files_on_commit(
+                instance.image.name, instance.thumbnail.name
+            )
+            validated_data['thumbnail'] = ''
+            schedule_thumbnail(instance)
+        self._update_ingredients(instance, ingredients)
+        instance = super().update(instance, validated_data)
+        update_search_vectors([instance.pk])
+        return instance
+
+    def _update_ingredients(self, recipe, ingredients):
+        """Меняет только то, что изменилось: вставка, amount, удаление.
+
+        Строки не пересоздаются, поэтому их id сохраняются, а при
+        правке одного текста рецепта в таблицу ничего не пишется.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        removed = [
+            item.id for ingredient_id, item in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        self._create_ingredients(
+            [
+                ingredient for ingredient in ingredients
+                if ingredient['id'] not in existing
+            ],
+            recipe
+        )
+        change_recipe_amounts(recipe, old_amounts, new_amounts)
 
     def _create_ingredients(self, ingredients, recipe):
+        if not ingredients:
+            return
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
@@ -125,4 +193,32 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def to_representation(self, instance):
-        return RecipeReadSerializer(instance, context=self.context).data 
\ No newline at end of file
+        return RecipeReadSerializer(instance, context=self.context).data
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Списки id рецептов для пакетного добавления и удаления."""
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE
+    )
+
+    def validate(self, data):
+        # Повторы убираем, порядок сохраняем для ответа.
+        add = list(dict.fromkeys(data.get('add', [])))
+        remove = list(dict.fromkeys(data.get('remove', [])))
+        if not add and not remove:
+            raise serializers.ValidationError(
+                'Передайте id рецептов в add или remove'
+            )
+        if set(add) & set(remove):
+            raise serializers.ValidationError(
+                'Рецепт не может быть одновременно в add и remove'
+            )
+        return {'add': add, 'remove': remove}
@@ -0,0 +1,320 @@
+import csv
+import io
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from foodgram.db_router import read_from
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+'''Список покупок.
+Суммы ингредиентов по корзине хранятся в ShoppingListItem и меняются
+на разницу при добавлении/удалении рецепта из корзины и при изменении
+ингредиентов рецепта, поэтому выгрузка - это одно чтение по индексу.
+Строки читаются курсором (iterator) или, в async-вьюхе, страницами по
+ключу, а файл отдаётся через StreamingHttpResponse по мере
+формирования строк.'''
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_FLUSH_SIZE = 64 * 1024
+
+
+def get_recipe_amounts(recipe):
+    """Количества ингредиентов рецепта (объекта или id)."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def lock_users(user_ids):
+    """Блокировка пользователей сериализует изменения их списков.
+
+    Без неё параллельные прибавки могут потеряться. Вызывать внутри
+    транзакции.
+    """
+    list(User.objects.select_for_update().filter(
+        id__in=user_ids
+    ).order_by('id').values_list('id', flat=True))
+
+
+def apply_amounts(user_ids, amounts):
+    """Прибавляет к спискам покупок пользователей разницу amounts."""
+    amounts = {
+        ingredient_id: amount
+        for ingredient_id, amount in amounts.items() if amount
+    }
+    if not amounts:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        lock_users(user_ids)
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=amounts
+        )
+        items.update(total_amount=F('total_amount') + Case(
+            *(When(ingredient_id=ingredient_id, then=Value(amount))
+              for ingredient_id, amount in amounts.items()),
+            output_field=IntegerField()
+        ))
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=amount
+            )
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing
+        )
+        items.filter(total_amount__lte=0).delete()
+
+
+def add_to_shopping_list(user, recipe):
+    apply_amounts([user.id], get_recipe_amounts(recipe))
+
+
+def remove_from_shopping_list(user, recipe):
+    apply_amounts([user.id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe).items()
+    })
+
+
+def change_recipe_amounts(recipe, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта во все корзины с ним."""
+    apply_amounts(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user_id', flat=True
+        ),
+        {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+    )
+
+
+def calculate_shopping_lists(user_ids):
+    """Суммы, посчитанные заново по корзинам: {(user, ingredient): amount}."""
+    return {
+        (user_id, ingredient_id): total_amount
+        for user_id, ingredient_id, total_amount
+        in RecipeIngredient.objects.filter(
+            recipe__in_shopping_cart__user_id__in=user_ids
+        ).values_list(
+            'recipe__in_shopping_cart__user_id', 'ingredient_id'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+    }
+
+
+def rebuild_shopping_lists(user_ids):
+    """Пересобирает списки покупок пользователей с нуля."""
+    with transaction.atomic():
+        lock_users(user_ids)
+        totals = calculate_shopping_lists(user_ids)
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount
+            )
+            for (user_id, ingredient_id), total_amount in totals.items()
+        )
+
+
+def shopping_list_rows(user):
+    """Строки (название, единица, количество), отсортированные по названию."""
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+    ).order_by('ingredient__name', 'ingredient_id')
+
+
+def get_shopping_list_rows(user):
+    return shopping_list_rows(user).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _pages(rows):
+    rows = iter(rows)
+    while page := list(islice(rows, CHUNK_SIZE)):
+        yield page
+
+
+async def ashopping_list_pages(user, using=None):
+    """Строки списка страницами по CHUNK_SIZE для async-вьюх.
+
+    Каждая страница - отдельный запрос по ключу (название, id
+    ингредиента), поэтому в памяти не больше одной страницы, а поток
+    занимается только на время запроса. Чтение идёт в using: генератор
+    выполняется при отдаче ответа, вне блока read_from вьюхи.
+    """
+    queryset = shopping_list_rows(user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount',
+        'ingredient_id'
+    )
+    after = Q()
+    while True:
+        with read_from(using):
+            page = [
+                row async for row in queryset.filter(after)[:CHUNK_SIZE]
+            ]
+        if page:
+            yield [row[:3] for row in page]
+        if len(page) < CHUNK_SIZE:
+            return
+        name, *_, ingredient_id = page[-1]
+        after = Q(ingredient__name__gt=name) | Q(
+            ingredient__name=name, ingredient_id__gt=ingredient_id
+        )
+
+
+class TxtRenderer:
+    """Файл собирается по страницам строк: start, page на каждую
+    страницу и finish возвращают куски ответа."""
+    def start(self):
+        return ()
+
+    def page(self, rows):
+        yield ''.join(
+            f'{name} ({measurement_unit}) — {total_amount}\n'
+            for name, measurement_unit, total_amount in rows
+        )
+
+    def finish(self):
+        return ()
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+class CsvRenderer(TxtRenderer):
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def start(self):
+        yield self.writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        )
+
+    def page(self, rows):
+        yield ''.join(self.writer.writerow(row) for row in rows)
+
+
+def _get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    path = settings.SHOPPING_LIST_PDF_FONT
+    if not path or not os.path.exists(path):
+        # Встроенный шрифт не содержит кириллицы, но файл всё равно будет.
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, path))
+    return PDF_FONT_NAME
+
+
+class PdfRenderer(TxtRenderer):
+    # reportlab собирает документ в памяти целиком, поэтому PDF уходит
+    # частями уже после сборки; строки при этом всё равно читаются
+    # страницами.
+    def start(self):
+        self.buffer = io.BytesIO()
+        self.pdf = canvas.Canvas(self.buffer, pagesize=A4)
+        self.font = _get_pdf_font()
+        _, self.height = A4
+        self.y = self.height - PDF_MARGIN
+        self.pdf.setFont(self.font, PDF_FONT_SIZE + 4)
+        self.pdf.drawString(PDF_MARGIN, self.y, 'Список покупок')
+        self.y -= PDF_LINE_HEIGHT * 2
+        self.pdf.setFont(self.font, PDF_FONT_SIZE)
+        return ()
+
+    def page(self, rows):
+        for name, measurement_unit, total_amount in rows:
+            if self.y < PDF_MARGIN:
+                self.pdf.showPage()
+                self.pdf.setFont(self.font, PDF_FONT_SIZE)
+                self.y = self.height - PDF_MARGIN
+            self.pdf.drawString(
+                PDF_MARGIN, self.y,
+                f'{name} ({measurement_unit}) — {total_amount}'
+            )
+            self.y -= PDF_LINE_HEIGHT
+        return ()
+
+    def finish(self):
+        self.pdf.save()
+        self.buffer.seek(0)
+        while chunk := self.buffer.read(PDF_FLUSH_SIZE):
+            yield chunk
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (TxtRenderer, 'text/plain; charset=utf-8'),
+    'csv': (CsvRenderer, 'text/csv; charset=utf-8'),
+    'pdf': (PdfRenderer, 'application/pdf'),
+}
+
+
+def _render(renderer, pages):
+    yield from renderer.start()
+    for rows in pages:
+        yield from renderer.page(rows)
+    yield from renderer.finish()
+
+
+async def _arender(renderer, pages):
+    for chunk in renderer.start():
+        yield chunk
+    async for rows in pages:
+        for chunk in renderer.page(rows):
+            yield chunk
+    for chunk in renderer.finish():
+        yield chunk
+
+
+def shopping_list_response(rows, file_format, asynchronous=False):
+    """Файл списка покупок.
+
+    asynchronous - для async-вьюх: rows - асинхронный итератор страниц
+    (ashopping_list_pages), и под ASGI ответ отдаётся без потока на
+    каждый фрагмент.
+    """
+    renderer, content_type = SHOPPING_LIST_FORMATS[file_format]
+    if asynchronous:
+        content = _arender(renderer(), rows)
+    else:
+        content = _render(renderer(), _pages(rows))
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"'
+    )
+    return response
@@ -0,0 +1,69 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_ingredients, invalidate_recipe
+from .conditional import INGREDIENTS_TABLE
+from .counters import count_recipes
+from .models import Ingredient, Recipe, TableVersion
+from .pagination import invalidate_counts
+from .search import recipe_search, update_search_vectors
+from .shopping_list import change_recipe_amounts, get_recipe_amounts
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    TableVersion.bump(INGREDIENTS_TABLE)
+    # Кэш анонимных ответов: после фиксации, иначе параллельный запрос
+    # успеет положить старые данные под новой версией.
+    transaction.on_commit(invalidate_ingredients)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipes_search(sender, instance, created, **kwargs):
+    """Название ингредиента входит в поисковый вектор рецептов."""
+    if not created:
+        update_search_vectors(
+            instance.recipe_ingredients.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(sender, instance, created, **kwargs):
+    """Версии кэша и ETag при любом изменении рецепта (API, админка, ORM).
+
+    После фиксации: ингредиенты пишутся в той же транзакции позже
+    рецепта, а параллельный запрос не должен успеть положить в кэш
+    старые данные под новой версией.
+    """
+    transaction.on_commit(partial(invalidate_recipe, instance.pk))
+    if created:
+        transaction.on_commit(partial(invalidate_counts, Recipe))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    recipe_search.invalidate()
+    transaction.on_commit(partial(invalidate_recipe, instance.pk))
+    transaction.on_commit(partial(invalidate_counts, Recipe))
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    """Пара к remove_deleted_recipe: recipes_count меняется на любом пути
+    создания (API, админка, ORM), а не только во вьюхе."""
+    if created:
+        count_recipes(instance.author_id, 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe(sender, instance, **kwargs):
+    """Любое удаление рецепта: через API, админку или вместе с автором.
+
+    Корзины и ингредиенты рецепта удаляются каскадом позже, поэтому
+    вычесть его из списков покупок можно только здесь.
+    """
+    change_recipe_amounts(instance, get_recipe_amounts(instance), {})
+    count_recipes(instance.author_id, -1)
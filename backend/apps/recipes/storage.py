@@ -0,0 +1,64 @@
+import hashlib
+import os
+import time
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы хранятся под sha256 содержимого.
+
+    Одинаковые картинки сохраняются один раз: имя файла - хэш, каталог
+    (recipes/, users/ и т.д.) берётся из upload_to. Так как файл может
+    использоваться несколькими записями, удалять его нужно через
+    apps.recipes.images.release_file.
+
+    Запись, которая ссылается на уже существующий файл, может быть ещё
+    не зафиксирована, и count_references её не видит. Поэтому save
+    обновляет mtime такого файла, а удаление (delete_stale и
+    collect_media) не трогает файлы моложе MEDIA_GRACE_MINUTES.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length=max_length)
+        return name
+
+    def delete_stale(self, name, max_age):
+        """Удаляет файл, если его не сохраняли последние max_age секунд.
+
+        Файл сначала переименовывается: если save успел обновить mtime
+        до переименования, файл возвращается на место, а если после -
+        save не найдёт файл и запишет его заново.
+        """
+        path = self.path(name)
+        removed = f'{path}.removed'
+        try:
+            os.rename(path, removed)
+        except FileNotFoundError:
+            return False
+        if os.path.getmtime(removed) > time.time() - max_age:
+            os.replace(removed, path)
+            return False
+        os.remove(removed)
+        return True
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + ext)
@@ -0,0 +1,735 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import (
+    AsyncClient, SimpleTestCase, TestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from psycopg2 import extensions
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram import urls
+from foodgram.db_pool.base import DatabaseWrapper, PoolTimeout
+from foodgram.db_router import PIN_KEY, ReplicaRouter
+from .cache import invalidate_ingredients
+from .checks import check_shared_cache
+from .conditional import INGREDIENTS_TABLE
+from .counters import counter_mismatches
+from .images import release_file
+from .ingredient_index import ingredient_index
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, TableVersion
+)
+from .search import ranked_recipe_ids, recipe_search
+from .shopping_list import rebuild_shopping_lists
+from .urls import async_urlpatterns
+
+User = get_user_model()
+
+# Маршруты как под ASGI (ASYNC_VIEWS) - для AsyncViewsTest.
+urlpatterns = [
+    path('api/', include(async_urlpatterns())),
+    *urls.urlpatterns,
+]
+
+
+class RecipeTestCase(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipe = self.create_recipe('Рецепт')
+        self.anonymous = APIClient()
+
+    def create_recipe(self, name, author=None):
+        recipe = Recipe.objects.create(
+            author=author or self.author, name=name, text='Текст',
+            cooking_time=5, image='recipes/image.png'
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=10
+        )
+        return recipe
+
+
+class AnonymousCacheTest(RecipeTestCase):
+    def test_ingredient_rename_invalidates_cache(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        for page in (url, '/api/recipes/'):
+            self.anonymous.get(page)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'Сахар'
+            self.ingredient.save()
+        detail = self.anonymous.get(url).json()
+        self.assertEqual(detail['ingredients'][0]['name'], 'Сахар')
+        recipes = self.anonymous.get('/api/recipes/').json()['results']
+        self.assertEqual(recipes[0]['ingredients'][0]['name'], 'Сахар')
+
+
+class RecipesCountTest(RecipeTestCase):
+    def recipes_count(self):
+        self.author.refresh_from_db(fields=['recipes_count'])
+        return self.author.recipes_count
+
+    def test_created_outside_api(self):
+        # self.recipe создан через ORM, как в админке.
+        self.assertEqual(self.recipes_count(), 1)
+        self.create_recipe('Второй')
+        self.assertEqual(self.recipes_count(), 2)
+        Recipe.objects.filter(author=self.author).delete()
+        self.assertEqual(self.recipes_count(), 0)
+
+
+class IngredientSearchTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        # Откат транзакции теста возвращает прежнюю TableVersion,
+        # индекс процесса с этой версией остался бы от другого теста.
+        ingredient_index.clear()
+
+    def search(self, **headers):
+        response = self.anonymous.get(
+            '/api/ingredients/', {'name': 'са'}, **headers
+        )
+        return response['ETag'], [row['name'] for row in response.json()]
+
+    def rename_on_other_worker(self):
+        # Сигналы этого процесса не срабатывают.
+        Ingredient.objects.filter(pk=self.ingredient.pk).update(
+            name='Сахар'
+        )
+        TableVersion.bump(INGREDIENTS_TABLE)
+
+    def test_search_without_queries(self):
+        Ingredient.objects.create(name='Сало', measurement_unit='г')
+        self.search()
+        with self.assertNumQueries(0):
+            response = self.anonymous.get('/api/ingredients/', {'name': 'С'})
+        self.assertEqual(response.json(), [
+            {'id': response.json()[0]['id'], 'name': 'Сало',
+             'measurement_unit': 'г'},
+            {'id': self.ingredient.pk, 'name': 'Соль',
+             'measurement_unit': 'г'},
+        ])
+
+    def test_change_on_other_worker_rebuilds_index(self):
+        etag, names = self.search()
+        self.assertEqual(names, [])
+        self.rename_on_other_worker()
+        invalidate_ingredients()
+        new_etag, names = self.search(HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(names, ['Сахар'])
+
+    @override_settings(INGREDIENT_INDEX_CHECK_INTERVAL=0)
+    def test_database_check_without_cache_version(self):
+        etag, _ = self.search()
+        self.rename_on_other_worker()
+        _, names = self.search()
+        self.assertEqual(names, ['Сахар'])
+
+
+class RecipeSearchTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        # Индекс процесса мог остаться от другого теста.
+        recipe_search.invalidate()
+
+    def search(self, query):
+        response = self.anonymous.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_ranking_order(self):
+        in_text = self.create_recipe('Обед')
+        in_text.text = 'Подавать борщ горячим'
+        in_text.save()
+        in_ingredients = self.create_recipe('Ужин')
+        RecipeIngredient.objects.create(
+            recipe=in_ingredients, amount=1,
+            ingredient=Ingredient.objects.create(
+                name='Борщевая заправка', measurement_unit='г'
+            )
+        )
+        self.create_recipe('Борщ')
+        self.assertEqual(self.search('борщ'), ['Борщ', 'Ужин', 'Обед'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search('несуществующее'), [])
+
+    def test_result_cap(self):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=self.author, name=f'Суп {number}', text='Текст',
+                cooking_time=5, image='recipes/image.png'
+            )
+            for number in range(settings.SEARCH_MAX_RESULTS + 1)
+        )
+        ids = ranked_recipe_ids('суп')
+        self.assertEqual(len(ids), settings.SEARCH_MAX_RESULTS)
+        # При равном весе новые рецепты выше.
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_ingredient_rename_on_other_worker(self):
+        self.assertEqual(self.search('сахар'), [])
+        # Сигналы этого процесса не срабатывают, кэш ответов сбросил
+        # после фиксации сигнал другого.
+        Ingredient.objects.filter(pk=self.ingredient.pk).update(
+            name='Сахар'
+        )
+        TableVersion.bump(INGREDIENTS_TABLE)
+        invalidate_ingredients()
+        self.assertEqual(self.search('сахар'), ['Рецепт'])
+
+
+class AuthenticatedTestCase(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+
+class ConditionalGetTest(AuthenticatedTestCase):
+    def test_not_modified_without_queries(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_favorite_changes_etag(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_favorited'])
+
+    def test_edits_outside_api_change_etag(self):
+        # Как в админке: модели сохраняются без вьюсетов.
+        url = f'/api/recipes/{self.recipe.pk}/'
+        for model, field, value in (
+            (self.recipe, 'name', 'Новое название'),
+            (self.author, 'first_name', 'Другое имя'),
+        ):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                setattr(model, field, value)
+                model.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Новое название')
+        self.assertEqual(response.json()['author']['first_name'], 'Другое имя')
+
+    def test_process_local_cache_warning(self):
+        with override_settings(DEBUG=False):
+            warnings = check_shared_cache(None)
+        self.assertEqual(
+            [warning.id for warning in warnings], ['recipes.W001']
+        )
+
+
+class RelationTest(AuthenticatedTestCase):
+    def test_add_favorite(self):
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'Рецепт')
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        response = self.client.post('/api/recipes/0/favorite/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_remove_cart(self):
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.client.post(url)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        response = self.client.delete('/api/recipes/0/shopping_cart/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(counter_mismatches(), [])
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['recipes_count'], 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.get('/api/recipes/feed/').json()[
+            'results'
+        ][0]['id'], self.recipe.pk)
+        self.author.refresh_from_db(fields=['followers_count'])
+        self.assertEqual(self.author.followers_count, 1)
+        response = self.client.post(f'/api/users/{self.user.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        response = self.client.post('/api/users/0/subscribe/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(counter_mismatches(), [])
+
+    def test_mismatches(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(counter_mismatches(), [
+            ('recipes.Recipe', self.recipe.pk, 'favorites_count', 0, 1)
+        ])
+
+
+class BatchTest(AuthenticatedTestCase):
+    def counters(self, *recipes):
+        return [
+            Recipe.objects.values_list(
+                'favorites_count', 'cart_count'
+            ).get(pk=recipe.pk)
+            for recipe in recipes
+        ]
+
+    def test_mixed_batch(self):
+        second = self.create_recipe('Второй')
+        third = self.create_recipe('Третий')
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.client.post(f'/api/recipes/{third.pk}/favorite/')
+        response = self.client.post('/api/recipes/favorite/batch/', {
+            'add': [self.recipe.pk, second.pk, second.pk, 999999],
+            'remove': [third.pk, 999998],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'add': [
+                {'id': self.recipe.pk, 'status': 'exists'},
+                {'id': second.pk, 'status': 'added'},
+                {'id': 999999, 'status': 'not_found'},
+            ],
+            'remove': [
+                {'id': third.pk, 'status': 'removed'},
+                {'id': 999998, 'status': 'not_found'},
+            ],
+        })
+        self.assertEqual(
+            self.counters(self.recipe, second, third),
+            [(1, 0), (1, 0), (0, 0)]
+        )
+        response = self.client.post('/api/recipes/favorite/batch/', {
+            'remove': [second.pk, second.pk],
+        }, format='json')
+        self.assertEqual(
+            response.json()['remove'], [{'id': second.pk, 'status': 'removed'}]
+        )
+        response = self.client.post('/api/recipes/favorite/batch/', {
+            'remove': [second.pk],
+        }, format='json')
+        self.assertEqual(
+            response.json()['remove'], [{'id': second.pk, 'status': 'absent'}]
+        )
+        self.assertEqual(self.counters(second), [(0, 0)])
+
+    def test_cart_batch_updates_shopping_list(self):
+        second = self.create_recipe('Второй')
+        self.client.post('/api/recipes/shopping_cart/batch/', {
+            'add': [self.recipe.pk, second.pk],
+        }, format='json')
+        self.assertEqual(
+            self.counters(self.recipe, second), [(0, 1), (0, 1)]
+        )
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Соль (г) — 20\n'
+        )
+
+    def test_empty_or_overlapping_batch(self):
+        for data in ({}, {'add': [1], 'remove': [1]}):
+            response = self.client.post(
+                '/api/recipes/favorite/batch/', data, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class RecipeListQueriesTest(AuthenticatedTestCase):
+    def count_queries(self, client, limit):
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(len(response.json()['results']), limit)
+        return len(queries)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for i in range(50):
+            recipe = self.create_recipe(f'Рецепт {i}')
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        for client in (self.anonymous, self.client):
+            with self.subTest(anonymous=client is self.anonymous):
+                self.assertEqual(
+                    self.count_queries(client, 5),
+                    self.count_queries(client, 50)
+                )
+
+
+class FeedTest(AuthenticatedTestCase):
+    def test_cursor_round_trip(self):
+        other = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        for i in range(5):
+            self.create_recipe(f'Рецепт {i}')
+            self.create_recipe(f'Другой {i}', author=other)
+        # Рецепт автора без подписчиков в ленту не попадает.
+        self.create_recipe('Чужой', author=self.user)
+        expected = list(Recipe.objects.exclude(author=self.user).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        for author in (self.author, other):
+            self.client.post(f'/api/users/{author.pk}/subscribe/')
+        # Раскладка по лентам и подмешивание популярных авторов.
+        for threshold in (1000, 0):
+            with self.subTest(threshold=threshold), override_settings(
+                FEED_FANOUT_THRESHOLD=threshold
+            ):
+                ids = []
+                url = '/api/recipes/feed/?pagination=cursor&limit=4'
+                while url is not None:
+                    data = self.client.get(url).json()
+                    ids += [recipe['id'] for recipe in data['results']]
+                    url = data['next']
+                self.assertEqual(ids, expected)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(AuthenticatedTestCase):
+    def read_aliases(self, method, url):
+        """Куда роутер направил чтения запроса (None - default)."""
+        aliases = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            # Реплики в тестах нет: сами запросы идут в default.
+            return None
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', record):
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 400)
+        return aliases
+
+    def test_reads_writes_and_pin(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        aliases = self.read_aliases('get', url)
+        # Токен проверяется на основной базе, данные - с реплики.
+        self.assertEqual(aliases[0], None)
+        self.assertIn('replica', aliases)
+        self.assertEqual(ReplicaRouter().db_for_write(Recipe), 'default')
+        self.assertEqual(
+            set(self.read_aliases('post', url + 'favorite/')), {None}
+        )
+        # Сразу после записи пользователь читает свои изменения.
+        self.assertEqual(set(self.read_aliases('get', url)), {None})
+        caches[settings.REPLICA_PIN_CACHE_ALIAS].delete(
+            PIN_KEY.format(self.user.pk)
+        )
+        self.assertIn('replica', self.read_aliases('get', url))
+
+
+class FakeConnection:
+    """Соединение psycopg2 в объёме, который нужен пулу."""
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.info = SimpleNamespace(
+            transaction_status=extensions.TRANSACTION_STATUS_IDLE
+        )
+
+    def rollback(self):
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    alias = 'pool_test'
+
+    def setUp(self):
+        self.connection = DatabaseWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'foodgram.db_pool',
+            'CONN_HEALTH_CHECKS': False,
+            'OPTIONS': {'pool': {'max_size': 1, 'timeout': 0.05}},
+        }, self.alias)
+        self.opened = []
+        patcher = mock.patch.object(
+            DatabaseWrapper, '_connect',
+            lambda wrapper, params: self.connect
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(
+            DatabaseWrapper._pools.pop, (self.alias, os.getpid()), None
+        )
+
+    def connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def open(self):
+        self.connection.connection = self.connection.get_new_connection({})
+        return self.connection.connection
+
+    def test_close_returns_connection(self):
+        first = self.open()
+        # Незавершённая транзакция откатывается при возврате.
+        first.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        self.connection.close()
+        self.assertFalse(first.closed)
+        self.assertIs(self.open(), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_broken_connection_is_replaced(self):
+        self.open().close()
+        self.connection.close()
+        self.assertIsNot(self.open(), self.opened[0])
+        self.assertEqual(len(self.opened), 2)
+
+    def test_exhausted_pool(self):
+        first = self.open()
+        with self.assertRaises(PoolTimeout):
+            self.connection.get_new_connection({})
+        # Ожидающий получает соединение, как только его вернут.
+        self.connection.pool.timeout = 5
+        with ThreadPoolExecutor(1) as executor:
+            waiter = executor.submit(self.connection.pool.get, self.connect)
+            self.connection.close()
+            self.assertIs(waiter.result(), first)
+        self.assertEqual(len(self.opened), 1)
+
+
+class ServerTimingTest(AuthenticatedTestCase):
+    def test_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        timings = dict(
+            entry.split(';', 1)
+            for entry in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timings), {'db', 'serializer', 'total'})
+        self.assertRegex(
+            timings['db'], rf'^dur=[\d.]+;desc="{len(queries)} queries"$'
+        )
+        durations = {
+            name: float(timing.split(';')[0][len('dur='):])
+            for name, timing in timings.items()
+        }
+        self.assertGreater(durations['serializer'], 0)
+        # Запросы из сериализатора входят и в db, и в serializer.
+        for name in ('db', 'serializer'):
+            self.assertLessEqual(durations[name], durations['total'])
+
+
+class CursorPaginationTest(AuthenticatedTestCase):
+    def test_round_trip(self):
+        for i in range(12):
+            self.create_recipe(f'Рецепт {i}')
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        )
+        ids = []
+        while True:
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids += [recipe['id'] for recipe in data['results']]
+            if data['next'] is None:
+                break
+            # Новый рецепт сдвинул бы OFFSET, но не курсор.
+            self.create_recipe(f'Новый {len(ids)}')
+            response = self.client.get(data['next'])
+        self.assertEqual(ids, expected)
+
+    def test_count_on_request(self):
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'count': 'true'}
+        )
+        self.assertEqual(response.json()['count'], 1)
+
+
+class ShoppingListTest(AuthenticatedTestCase):
+    def shopping_list(self, file_format='txt'):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'file_format': file_format}
+        )
+        content = b''.join(response.streaming_content)
+        return content.decode('latin-1' if file_format == 'pdf' else 'utf-8')
+
+    def test_formats(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.assertEqual(self.shopping_list('csv').splitlines(), [
+            'Ингредиент,Единица измерения,Количество', 'Соль,г,10'
+        ])
+        self.assertTrue(self.shopping_list('pdf').startswith('%PDF'))
+
+    def test_deleted_author_leaves_shopping_lists(self):
+        kept = self.create_recipe('Другой рецепт', author=self.user)
+        for recipe in (self.recipe, kept):
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertIn('Соль (г) — 20', self.shopping_list())
+        self.author.delete()
+        self.assertIn('Соль (г) — 10', self.shopping_list())
+        self.assertEqual(
+            self.client.get('/api/recipes/').json()['count'], 1
+        )
+        self.client.delete(f'/api/recipes/{kept.pk}/')
+        self.assertEqual(self.shopping_list(), '')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StorageTest(TestCase):
+    def tearDown(self):
+        shutil.rmtree(default_storage.location, ignore_errors=True)
+
+    def save(self):
+        return default_storage.save('recipes/a.png', ContentFile(b'image'))
+
+    def age(self, name, seconds):
+        path = default_storage.path(name)
+        mtime = os.path.getmtime(path) - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_reused_file_survives_release(self):
+        name = self.save()
+        self.age(name, 2 * 60 * 60)
+        # Та же картинка в ещё не зафиксированной записи.
+        self.assertEqual(self.save(), name)
+        release_file(name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_stale_file_is_released(self):
+        name = self.save()
+        self.age(name, 2 * 60 * 60)
+        release_file(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(self.save(), name)
+        self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTest(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+        # Заголовки из конструктора AsyncClient в Django 4.2 не доходят
+        # до request.META, поэтому передаются в каждый запрос.
+        self.auth = {
+            'authorization': self.client._credentials['HTTP_AUTHORIZATION']
+        }
+
+    async def rename_recipe(self):
+        # Без сигналов: кэш ответов об этом не узнает.
+        await Recipe.objects.filter(pk=self.recipe.pk).aupdate(name='Новое')
+
+    async def test_list_cold_and_warm_cache(self):
+        cold = await self.async_client.get('/api/recipes/')
+        self.assertEqual(cold.status_code, 200)
+        await self.rename_recipe()
+        warm = await self.async_client.get('/api/recipes/')
+        self.assertEqual(warm.json(), cold.json())
+        self.assertEqual(warm['ETag'], cold['ETag'])
+
+    async def test_detail_anonymous(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        cold = await self.async_client.get(url)
+        self.assertEqual(cold.json()['name'], 'Рецепт')
+        await self.rename_recipe()
+        response = await self.async_client.get(
+            url, headers={'if-none-match': cold['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get('/api/recipes/0/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_detail_authenticated(self):
+        await Favorite.objects.acreate(user=self.user, recipe=self.recipe)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = await self.async_client.get(url, headers=self.auth)
+        self.assertTrue(response.json()['is_favorited'])
+        response = await self.async_client.get(
+            url, headers={**self.auth, 'if-none-match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_ingredient_search(self):
+        await Ingredient.objects.acreate(name='Сахар', measurement_unit='г')
+        response = await self.async_client.get(
+            '/api/ingredients/', {'name': 'са'}
+        )
+        self.assertEqual(
+            [row['name'] for row in response.json()], ['Сахар']
+        )
+
+    async def test_download_in_pages(self):
+        await sync_to_async(self.fill_cart)()
+        with mock.patch('apps.recipes.shopping_list.CHUNK_SIZE', 2):
+            response = await self.async_client.get(
+                '/api/recipes/download_shopping_cart/', headers=self.auth
+            )
+            self.assertTrue(response.is_async)
+            content = b''.join([
+                chunk async for chunk in response.streaming_content
+            ]).decode()
+        self.assertEqual(content, (
+            'Мука (3) — 1\n'
+            'Перец (1) — 1\n'
+            'Перец (2) — 1\n'
+            'Сахар (0) — 1\n'
+            'Соль (г) — 10\n'
+        ))
+
+    def fill_cart(self):
+        # Одинаковые названия проверяют ключ страницы по id.
+        for unit, name in enumerate(('Сахар', 'Перец', 'Перец', 'Мука')):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, amount=1,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit=str(unit)
+                )
+            )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        rebuild_shopping_lists([self.user.pk])
+
+    async def test_bad_token(self):
+        headers = {'authorization': 'Token invalid'}
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            response = await self.async_client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 401)
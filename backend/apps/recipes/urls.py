@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from apps.recipes.views import RecipeViewSet, IngredientViewSet
@@ -6,6 +7,30 @@ router = DefaultRouter()
 router.register('recipes', RecipeViewSet)
 router.register('ingredients', IngredientViewSet)
 
-urlpatterns = [
+
+def async_urlpatterns():
+    from apps.recipes import async_views
+
+    # Те же имена, что у маршрутов роутера: reverse() не меняется.
+    return [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path(
+            'recipes/download_shopping_cart/',
+            async_views.download_shopping_cart,
+            name='recipes-download-shopping-cart'
+        ),
+        path(
+            'recipes/<int:pk>/', async_views.recipe_detail,
+            name='recipes-detail'
+        ),
+        path(
+            'ingredients/', async_views.ingredient_list,
+            name='ingredients-list'
+        ),
+    ]
+
+
+urlpatterns = async_urlpatterns() if settings.ASYNC_VIEWS else []
+urlpatterns += [
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
@@ -1,5 +1,5 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect
 
 from rest_framework import viewsets, status
@@ -9,11 +9,31 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
 from apps.users.serializers import RecipeShortSerializer
-from .models import Recipe, Ingredient, Favorite, ShoppingCart
-from .serializers import RecipeReadSerializer, RecipeWriteSerializer, IngredientSerializer
-from .pagination import RecipePagination
+from foodgram.db_router import ReplicaReadMixin
+from .models import Recipe, Ingredient, Favorite, ShoppingCart, TableVersion
+from .serializers import (
+    IngredientSerializer, RecipeBatchSerializer, RecipeReadSerializer,
+    RecipeWriteSerializer
+)
+from .cache import AnonymousResponseCacheMixin
+from .conditional import (
+    INGREDIENTS_TABLE, ConditionalGetMixin, recipe_validators
+)
+from .pagination import (
+    OptionalCursorPaginationMixin, RecipePagination, invalidate_counts
+)
+from .counters import (
+    add_relations, create_relation, remove_relations
+)
+from .feed import fan_out_recipe, get_feed
 from .filters import RecipeFilter, IngredientFilter
+from .images import release_files_on_commit
+from .ingredient_index import ingredient_index
 from .permissions import IsAuthorOrReadOnly
+from .shopping_list import (
+    SHOPPING_LIST_FORMATS, add_to_shopping_list, get_shopping_list_rows,
+    rebuild_shopping_lists, remove_from_shopping_list, shopping_list_response
+)
 
 
 def recipe_redirect(request, recipe_id):
@@ -21,20 +41,52 @@ def recipe_redirect(request, recipe_id):
     return redirect(f'/recipes/{recipe_id}/')
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ReplicaReadMixin, ConditionalGetMixin, AnonymousResponseCacheMixin,
+    OptionalCursorPaginationMixin, viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all()
+    lookup_value_regex = r'\d+'
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.for_read(self.request.user)
+        return Recipe.objects.with_user_flags(self.request.user)
+
+    def get_validators(self):
+        user = self.request.user
+        # Анонимные ответы кэшируются, ETag для них считается по данным.
+        if user.is_anonymous:
+            return None
+        if self.action == 'list':
+            # Порядок зависит от чужого избранного, версии его не видят.
+            if self.request.query_params.get('ordering') == 'popular':
+                return None
+            return recipe_validators(user), None
+        pk = str(self.kwargs.get('pk'))
+        if not pk.isdigit():
+            return None
+        return recipe_validators(user, pk), None
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        fan_out_recipe(recipe)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Списки покупок, счётчик автора и кэш - в signals.
+        instance.delete()
+        release_files_on_commit(instance.image.name, instance.thumbnail.name)
 
     @action(
         detail=True,
@@ -55,28 +107,152 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['get'],
         permission_classes=[IsAuthenticated]
     )
-    def download_shopping_cart(self, request):
-        ingredients = Ingredient.objects.filter(
-            recipe_ingredients__recipe__in_shopping_cart__user=request.user
-        ).annotate(
-            total_amount=Sum('recipe_ingredients__amount')
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым."""
+        recipes = get_feed(
+            request.user, Recipe.objects.for_read(request.user)
         )
+        page = self.paginate_queryset(recipes)
+        serializer = RecipeReadSerializer(
+            page, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
 
-        shopping_list = []
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient.name} ({ingredient.measurement_unit}) — '
-                f'{ingredient.total_amount}'
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def download_shopping_cart(self, request):
+        """Список покупок в формате txt (по умолчанию), csv или pdf."""
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Неподдерживаемый формат файла'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
-        response = HttpResponse(
-            '\n'.join(shopping_list),
-            content_type='text/plain'
+        return shopping_list_response(
+            get_shopping_list_rows(request.user),
+            file_format
         )
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+
+    def add_relation(self, model, error, on_add=None):
+        """Добавляет рецепт в избранное/корзину.
+
+        Проверки «уже добавлен» нет: её делает уникальное ограничение
+        (см. create_relation), поэтому параллельные запросы не приводят
+        к ошибке 500. Транзакция нужна только вместе с on_add.
+        """
+        user = self.request.user
+        if on_add is None:
+            recipe = create_relation(model, user, self.kwargs['pk'])
+        else:
+            with transaction.atomic():
+                recipe = create_relation(model, user, self.kwargs['pk'])
+                if recipe is not None:
+                    on_add(user, recipe)
+        if recipe is None:
+            get_object_or_404(Recipe, pk=self.kwargs['pk'])
+            return Response(
+                {'errors': error},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        invalidate_counts(user=user)
+        serializer = RecipeShortSerializer(
+            recipe, context={'request': self.request}
         )
-        return response
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_relation(self, model, error, on_remove=None):
+        """Удаляет рецепт из избранного/корзины.
+
+        На PostgreSQL связь и счётчик меняет один запрос (см.
+        counters._change_relations); транзакция нужна только вместе
+        с on_remove.
+        """
+        user = self.request.user
+        recipe_id = Recipe._meta.pk.get_prep_value(self.kwargs['pk'])
+        if on_remove is None:
+            removed = remove_relations(model, user, [recipe_id])
+        else:
+            with transaction.atomic():
+                removed = remove_relations(model, user, [recipe_id])
+                if removed:
+                    on_remove(user, recipe_id)
+        if not removed:
+            get_object_or_404(Recipe, pk=recipe_id)
+            return Response(
+                {'errors': error},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        invalidate_counts(user=user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def batch_relations(self, model, on_change=None):
+        """Пакетное добавление/удаление рецептов из избранного/корзины.
+
+        Один запрос на добавление и один на удаление всего пакета (на
+        SQLite - несколько, см. counters._change_relations); в ответе
+        статус по каждому id.
+        """
+        serializer = RecipeBatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data['add']
+        remove = serializer.validated_data['remove']
+        user = self.request.user
+        with transaction.atomic():
+            found = set(Recipe.objects.filter(
+                id__in=add + remove
+            ).values_list('id', flat=True))
+            # Статусы и счётчики - по строкам, которые изменила запись,
+            # а не по прочитанным заранее: так параллельный одиночный
+            # запрос не сдвигает счётчики.
+            added = add_relations(
+                model, user, [pk for pk in add if pk in found]
+            )
+            removed = remove_relations(
+                model, user, [pk for pk in remove if pk in found]
+            )
+            if (added or removed) and on_change is not None:
+                on_change([user.id])
+        if added or removed:
+            invalidate_counts(user=user)
+        return Response({
+            'add': [
+                {'id': pk, 'status': (
+                    'not_found' if pk not in found
+                    else 'added' if pk in added else 'exists'
+                )}
+                for pk in add
+            ],
+            'remove': [
+                {'id': pk, 'status': (
+                    'not_found' if pk not in found
+                    else 'removed' if pk in removed else 'absent'
+                )}
+                for pk in remove
+            ],
+        })
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        # Суммы пересчитываются целиком под блокировкой пользователя:
+        # так они верны и при параллельных одиночных запросах.
+        return self.batch_relations(ShoppingCart, rebuild_shopping_lists)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        return self.batch_relations(Favorite)
 
     @action(
         detail=True,
@@ -84,35 +260,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk=None):
-        recipe = self.get_object()
-        
         if request.method == 'POST':
-            if ShoppingCart.objects.filter(user=request.user, recipe=recipe).exists():
-                return Response(
-                    {'errors': 'Рецепт уже добавлен в корзину'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            ShoppingCart.objects.create(
-                user=request.user,
-                recipe=recipe
+            return self.add_relation(
+                ShoppingCart,
+                'Рецепт уже добавлен в корзину',
+                add_to_shopping_list
             )
-            serializer = RecipeShortSerializer(recipe, context={'request': request})
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        
-        shopping_cart = ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=recipe
+        return self.remove_relation(
+            ShoppingCart,
+            'Рецепт не найден в корзине',
+            remove_from_shopping_list
         )
-        if not shopping_cart.exists():
-            return Response(
-                {'errors': 'Рецепт не найден в корзине'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        shopping_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -120,41 +278,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def favorite(self, request, pk=None):
-        recipe = self.get_object()
-        
         if request.method == 'POST':
-            if Favorite.objects.filter(user=request.user, recipe=recipe).exists():
-                return Response(
-                    {'errors': 'Рецепт уже добавлен в избранное'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            Favorite.objects.create(
-                user=request.user,
-                recipe=recipe
+            return self.add_relation(
+                Favorite, 'Рецепт уже добавлен в избранное'
             )
-            serializer = RecipeShortSerializer(recipe, context={'request': request})
+        return self.remove_relation(Favorite, 'Рецепт не найден в избранном')
 
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        
-        favorite = Favorite.objects.filter(
-            user=request.user,
-            recipe=recipe
-        )
-        if not favorite.exists():
-            return Response(
-                {'errors': 'Рецепт не найден в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
-
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    ReplicaReadMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter 
\ No newline at end of file
+    filterset_class = IngredientFilter
+    index_version = None
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name or not settings.INGREDIENT_INDEX_ENABLED:
+            return super().list(request, *args, **kwargs)
+        # Поиск по индексу в памяти: ни тело, ни ETag не ходят в базу.
+        snapshot = ingredient_index.snapshot()
+        self.index_version = snapshot.version
+        return self.conditional_response(lambda: Response(
+            snapshot.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+        ))
+
+    def get_validators(self):
+        if self.index_version is not None:
+            return (self.index_version,), None
+        return (TableVersion.get_version(INGREDIENTS_TABLE),), None
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+'''Кэш токенов для TokenAuthentication.
+Вместо запроса token JOIN user на каждый запрос id пользователя берётся
+из LRU-кэша процесса (AUTH_TOKEN_CACHE_SIZE записей, живут
+AUTH_TOKEN_CACHE_TTL секунд), а при промахе - из общего кэша, если он
+настроен. Других полей пользователя в кэше нет (ни хэша пароля, ни
+счётчиков): request.user содержит только id, остальные поля
+догружаются из базы при обращении. Записи удаляются при выходе,
+удалении токена и сохранении пользователя (смена пароля, блокировка);
+заодно в общем кэше меняется версия пользователя, и записи с прежней
+версией - локальные других процессов и общая, положенная запросом,
+прочитавшим токен до отзыва, - перестают действовать. Без общего
+кэша локальные записи устаревают не позже чем через
+AUTH_TOKEN_CACHE_TTL.'''
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local_cache = LRUCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL
+)
+
+
+def _shared_cache():
+    alias = settings.AUTH_TOKEN_CACHE_SHARED_ALIAS
+    return caches[alias] if alias else None
+
+
+def _cache_key(key):
+    # Сам токен в ключ не попадает.
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def _user_version(shared, user_id):
+    return shared.get(_version_key(user_id), 0)
+
+
+def _dump(token):
+    # Неактивные пользователи сюда не попадают: их отсекает DRF.
+    return {
+        'user_id': token.user_id,
+        'is_active': token.user.is_active,
+        'created': token.created,
+    }
+
+
+def _load(key, data):
+    if not data['is_active']:
+        raise exceptions.AuthenticationFailed(
+            _('User inactive or deleted.')
+        )
+    user = User.from_db('default', ['id'], [data['user_id']])
+    token = Token.from_db(
+        'default', ['key', 'user_id', 'created'],
+        [key, user.pk, data['created']]
+    )
+    token.user = user
+    return user, token
+
+
+def invalidate_tokens(user_id, *keys):
+    """Убирает токены пользователя из кэшей (после фиксации транзакции)."""
+    def invalidate():
+        shared = _shared_cache()
+        for key in keys:
+            local_cache.delete(_cache_key(key))
+            if shared is not None:
+                shared.delete(_cache_key(key))
+        if shared is not None:
+            shared.set(
+                _version_key(user_id), uuid.uuid4().hex,
+                settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT
+            )
+    transaction.on_commit(invalidate)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        shared = _shared_cache()
+        cached = local_cache.get(cache_key)
+        if cached is not None:
+            data, version = cached
+            # Токен могли отозвать в другом процессе.
+            if (
+                shared is None
+                or _user_version(shared, data['user_id']) == version
+            ):
+                return _load(key, data)
+        data = shared.get(cache_key) if shared is not None else None
+        if data is not None and (
+            _user_version(shared, data['user_id']) != data.get('version')
+        ):
+            # Запись положили после отзыва, прочитав токен до него.
+            data = None
+        if data is None:
+            user, token = super().authenticate_credentials(key)
+            data = _dump(token)
+            if shared is not None:
+                data['version'] = _user_version(shared, token.user_id)
+                # Отзыв, зафиксированный до чтения версии, виден в базе,
+                # после - меняет версию, и запись будет отвергнута.
+                if not Token.objects.filter(
+                    key=key, user__is_active=True
+                ).exists():
+                    raise exceptions.AuthenticationFailed(
+                        _('Invalid token.')
+                    )
+                shared.set(
+                    cache_key, data, settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT
+                )
+        local_cache.set(cache_key, (data, data.get('version')))
+        return _load(key, data)
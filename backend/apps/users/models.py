@@ -1,11 +1,56 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 
 MAX_LENGTH_NAME = 150
 MAX_LENGTH_EMAIL = 254
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    def with_is_subscribed(self, user):
+        """Флаг подписки текущего пользователя без запроса на каждую строку."""
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=Value(False))
+        return self.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            )
+        )
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class CountersMixin:
+    """Счётчики (COUNTER_FIELDS) не попадают в полное сохранение.
+
+    Их меняют только UPDATE с F() из apps.recipes.counters, а в объекте,
+    загруженном раньше, значение может быть устаревшим.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (
+            update_fields is None
+            and not force_insert
+            and not self._state.adding
+            and self.pk is not None
+        ):
+            skipped = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(
+            force_insert=force_insert, force_update=force_update,
+            using=using, update_fields=update_fields
+        )
+
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         max_length=MAX_LENGTH_EMAIL,
         unique=True
@@ -18,14 +63,43 @@ class User(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to='users/',
+        db_index=True,
         null=True,
         blank=True,
         default=None
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    # Счётчики меняет apps.recipes.counters.
+    recipes_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
+
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
+
+    objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
+    def refresh_from_db(self, using=None, fields=None):
+        # Пользователь из кэша токенов содержит только id: при первом
+        # обращении к другому полю догружаем их все одним запросом.
+        if fields is not None:
+            deferred = self.get_deferred_fields()
+            if deferred.intersection(fields):
+                fields = deferred.union(fields)
+        super().refresh_from_db(using=using, fields=fields)
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from apps.users.models import User
 from apps.recipes.models import Recipe
-from apps.recipes.fields import Base64ImageField
+from apps.recipes.fields import Base64ImageField, ThumbnailField
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -12,6 +12,12 @@ class AvatarSerializer(serializers.ModelSerializer):
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        # request.user может быть загружен давно: пишем только аватар.
+        instance.avatar = validated_data['avatar']
+        instance.save(update_fields=['avatar', 'updated_at'])
+        return instance
+
 
 class UserSerializer(DjoserUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
@@ -22,6 +28,8 @@ class UserSerializer(DjoserUserSerializer):
                  'last_name', 'is_subscribed', 'avatar')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -30,19 +38,27 @@ class UserSerializer(DjoserUserSerializer):
 
 class SubscriptionSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count')
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
+    # recipes_preview готовит CustomUserViewSet.get_subscriptions_queryset().
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()[
-            :int(self.context['request'].query_params.get('recipes_limit', 1000))
-        ]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            recipes = obj.recipes.all()[
+                :int(self.context['request'].query_params.get(
+                    'recipes_limit', 1000
+                ))
+            ]
         return RecipeShortSerializer(recipes, many=True).data
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    thumbnail = ThumbnailField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time') 
\ No newline at end of file
+        fields = ('id', 'name', 'image', 'thumbnail', 'cooking_time') 
\ No newline at end of file
@@ -0,0 +1,54 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from apps.recipes.cache import invalidate_author
+from apps.recipes.pagination import invalidate_counts
+from .authentication import invalidate_tokens
+from .models import User
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.user_id, instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Смена пароля или блокировка отзывает закэшированные токены."""
+    if not created:
+        invalidate_tokens(instance.pk, *Token.objects.filter(
+            user=instance
+        ).values_list('key', flat=True))
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        invalidate_tokens(user.pk, *Token.objects.filter(
+            user=user
+        ).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, created, update_fields,
+                          **kwargs):
+    """Версии кэша и ETag при изменении пользователя (API, админка, ORM).
+
+    Профиль автора встроен в его рецепты. Вход меняет только last_login,
+    которого в ответах нет.
+    """
+    if created:
+        transaction.on_commit(partial(invalidate_counts, User))
+    elif update_fields is None or set(update_fields) != {'last_login'}:
+        transaction.on_commit(partial(invalidate_author, instance))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, **kwargs):
+    # Рецепты автора удаляются каскадом со своими сигналами.
+    transaction.on_commit(partial(invalidate_counts, User))
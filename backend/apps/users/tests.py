@@ -0,0 +1,148 @@
+import base64
+import io
+import shutil
+import struct
+import tempfile
+import zlib
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.recipes.counters import count_followers, count_recipes
+from apps.recipes.models import Recipe
+from .authentication import _cache_key, local_cache
+from .models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png_base64(content=None):
+    if content is None:
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+        content = buffer.getvalue()
+    return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+
+def png_chunk(kind, data):
+    return (
+        struct.pack('>I', len(data)) + kind + data
+        + struct.pack('>I', zlib.crc32(kind + data))
+    )
+
+
+def decompression_bomb():
+    """PNG в сотню байт с заголовком на 50000x50000 пикселей."""
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        png_chunk(
+            b'IHDR', struct.pack('>IIBBBBB', 50000, 50000, 1, 0, 0, 0, 0)
+        ),
+        png_chunk(b'IDAT', zlib.compress(b'')),
+        png_chunk(b'IEND', b''),
+    ))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProfileTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def test_avatar_keeps_counters(self):
+        # Пользователь запроса может быть загружен до изменения счётчиков.
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        count_recipes(self.user.pk, 3)
+        count_followers(self.user.pk, 1)
+        response = self.client.put(
+            '/api/users/me/avatar/', {'avatar': png_base64()},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            (self.user.recipes_count, self.user.followers_count), (3, 1)
+        )
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            (self.user.recipes_count, self.user.followers_count), (3, 1)
+        )
+
+    def test_decompression_bomb_is_rejected(self):
+        response = self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': png_base64(decompression_bomb())}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('avatar', response.json())
+
+    def test_stale_save_keeps_counters(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/image.png'
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=2)
+        recipe.name = 'Другое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.name, recipe.favorites_count), ('Другое название', 2)
+        )
+
+
+@override_settings(AUTH_TOKEN_CACHE_SHARED_ALIAS='default')
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        local_cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_only_user_id_is_cached(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        (data, _), = [value for _, value in local_cache.data.values()]
+        self.assertEqual(
+            set(data), {'user_id', 'is_active', 'created', 'version'}
+        )
+
+    def test_logout_on_other_worker(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Локальный кэш другого процесса выход не очищает.
+        other_worker = dict(local_cache.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/token/logout/')
+        local_cache.data.update(other_worker)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_shared_entry_written_after_logout(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Запрос прочитал токен до выхода, а записал в общий кэш после.
+        shared = caches['default']
+        key = _cache_key(self.token.key)
+        entry = shared.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/token/logout/')
+        shared.set(key, entry)
+        local_cache.clear()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
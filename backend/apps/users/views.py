@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import F, Prefetch
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status
@@ -9,14 +11,72 @@ from djoser.views import UserViewSet
 
 from apps.users.models import User, Subscription
 from apps.users.serializers import UserSerializer, SubscriptionSerializer, AvatarSerializer
-from apps.recipes.pagination import RecipePagination
+from apps.recipes.conditional import ConditionalGetMixin
+from apps.recipes.counters import (
+    add_relations, release_user_counters, remove_relations
+)
+from apps.recipes.feed import backfill_feed, remove_from_feed
+from apps.recipes.images import release_files_on_commit
+from apps.recipes.models import Recipe
+from apps.recipes.pagination import (
+    RecipePagination, SubscriptionCursorPagination, invalidate_counts,
+    use_cursor_pagination
+)
+from foodgram.db_router import ReplicaReadMixin
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(ReplicaReadMixin, ConditionalGetMixin, UserViewSet):
     queryset = User.objects.all()
+    lookup_value_regex = r'\d+'
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
 
+    def get_validators(self):
+        user = self.request.user
+        # Список: ETag по данным ответа, без агрегатов по всей таблице.
+        if self.action != 'retrieve':
+            return None
+        pk = str(self.kwargs.get(self.lookup_field))
+        if not pk.isdigit():
+            return None
+        state = User.objects.filter(pk=pk).with_is_subscribed(
+            user
+        ).values_list('updated_at', 'is_subscribed').first()
+        if state is None:
+            return None
+        # Для анонима ответ зависит только от профиля, поэтому
+        # updated_at годится и как Last-Modified.
+        return state, state[0] if user.is_anonymous else None
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return max(limit, 0)
+
+    def get_subscriptions_queryset(self, authors):
+        """Авторы с флагом подписки и превью рецептов.
+
+        Превью ограничивается recipes_limit прямо в SQL, поэтому стоимость
+        запроса не зависит от количества подписок. Число рецептов берётся
+        из счётчика User.recipes_count.
+        """
+        return authors.with_is_subscribed(self.request.user).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_per_author(
+                    self.get_recipes_limit()
+                ),
+                to_attr='recipes_preview'
+            )
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        release_user_counters(instance)
+        super().perform_destroy(instance)
+
     @action(
         detail=False,
         methods=['get'],
@@ -35,15 +95,21 @@ class CustomUserViewSet(UserViewSet):
     def avatar(self, request):
         user = request.user
 
+        old_avatar = user.avatar.name
         if request.method == 'PUT':
             serializer = AvatarSerializer(
                 user, data=request.data, partial=False)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            if old_avatar != user.avatar.name:
+                release_files_on_commit(old_avatar)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         if user.avatar:
-            user.avatar.delete(save=True)
+            # Файл может быть общим с другими записями, удаляем по ссылкам.
+            user.avatar = None
+            user.save(update_fields=['avatar', 'updated_at'])
+            release_files_on_commit(old_avatar)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -53,41 +119,46 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-
+        author_id = User._meta.pk.get_prep_value(id)
         if request.method == 'POST':
-            if user == author:
+            if author_id == user.pk:
                 return Response(
                     {'error': 'Нельзя подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            subscription, created = Subscription.objects.get_or_create(
-                user=user,
-                author=author
-            )
-            if not created:
+            # Повторную подписку отсекает уникальное ограничение: на
+            # PostgreSQL подписка и счётчик - один запрос
+            # (apps.recipes.counters._change_relations).
+            with transaction.atomic():
+                added = add_relations(Subscription, user, [author_id])
+                if added:
+                    backfill_feed(user, User(pk=author_id))
+            if not added:
+                get_object_or_404(User, id=author_id)
                 return Response(
                     {'error': 'Вы уже подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            invalidate_counts(user=user)
             serializer = SubscriptionSerializer(
-                author,
+                self.get_subscriptions_queryset(
+                    User.objects.filter(pk=author_id)
+                ).get(),
                 context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        # Проверяем существование подписки
-        subscription = Subscription.objects.filter(
-            user=user,
-            author=author
-        )
-        if not subscription.exists():
+        with transaction.atomic():
+            removed = remove_relations(Subscription, user, [author_id])
+            if removed:
+                remove_from_feed(user, author_id)
+        if not removed:
+            get_object_or_404(User, id=author_id)
             return Response(
                 {'errors': 'Вы не подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        subscription.delete()
+        invalidate_counts(user=user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -96,8 +167,15 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        subscriptions = User.objects.filter(following__user=user)
-        paginator = RecipePagination()
+        subscriptions = self.get_subscriptions_queryset(
+            User.objects.filter(following__user=user).annotate(
+                subscription_id=F('following__id')
+            ).order_by('-subscription_id')
+        )
+        if use_cursor_pagination(request):
+            paginator = SubscriptionCursorPagination()
+        else:
+            paginator = RecipePagination()
         paginated_subscriptions = paginator.paginate_queryset(subscriptions, request)
         serializer = SubscriptionSerializer(
             paginated_subscriptions,
@@ -0,0 +1,34 @@
+import os
+import threading
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+# Async-вьюхи ходят в базу из разных потоков, и постоянное соединение
+# каждого из них висело бы до CONN_MAX_AGE; соединения переиспользует
+# пул (DB_POOL).
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+
+def warm_up():
+    if settings.DATABASE_WARM_UP:
+        from foodgram.db_pool import warm_up_connections
+
+        warm_up_connections()
+
+    if settings.INGREDIENT_INDEX_ENABLED:
+        from apps.recipes.ingredient_index import ingredient_index
+
+        ingredient_index.warm_up()
+
+
+# uvicorn импортирует приложение внутри цикла событий, а прогрев ходит в
+# базу синхронно - поэтому в отдельном потоке.
+warm_up_thread = threading.Thread(target=warm_up)
+warm_up_thread.start()
+warm_up_thread.join()
@@ -0,0 +1,25 @@
+import logging
+
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_connections():
+    """Соединения открываются при старте воркера, а не в первом запросе.
+
+    Пул заполняется до min_size; постоянное соединение (CONN_MAX_AGE)
+    открывается в текущем потоке. Если база недоступна, воркер всё равно
+    стартует.
+    """
+    for connection in connections.all():
+        try:
+            if getattr(connection, 'pooled', False):
+                connection.warm_up()
+            elif connection.settings_dict['CONN_MAX_AGE'] != 0:
+                connection.ensure_connection()
+        except DatabaseError as error:
+            logger.warning(
+                'Не удалось открыть соединение с %s: %s',
+                connection.alias, error
+            )
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from foodgram.metrics import registry
+
+'''Бэкенд PostgreSQL с пулом соединений в памяти процесса.
+Django закрывает соединение в конце запроса (CONN_MAX_AGE = 0), а этот
+бэкенд вместо закрытия возвращает его в пул, и следующий запрос не
+платит за TCP/TLS и аутентификацию. Настройки - в OPTIONS['pool'], как у
+встроенного пула Django 5.1: min_size, max_size (не больше потоков
+воркера), timeout (сколько ждать свободного соединения) и max_lifetime.
+Пул у каждого процесса свой: после fork создаётся заново.'''
+
+DEFAULT_POOL_OPTIONS = {
+    'min_size': 0,
+    'max_size': 4,
+    'timeout': 10,
+    'max_lifetime': 3600,
+}
+
+
+class PoolTimeout(base.Database.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, alias, min_size, max_size, timeout, max_lifetime,
+                 health_checks):
+        self.alias = alias
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_checks = health_checks
+        self.idle = deque()
+        self.opened_at = {}
+        # Соединения, которые сейчас открываются: место в пуле занято.
+        self.opening = 0
+        self.condition = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self.opened_at) + self.opening
+
+    def _open(self, connect):
+        connection = connect()
+        with self.condition:
+            self.opened_at[id(connection)] = time.monotonic()
+        registry.inc('db_connections_opened_total', (self.alias,))
+        return connection
+
+    def _discard(self, connection):
+        with self.condition:
+            self.opened_at.pop(id(connection), None)
+            self.condition.notify()
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+    def _is_usable(self, connection):
+        if connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def _is_expired(self, connection):
+        opened_at = self.opened_at.get(id(connection))
+        return (
+            opened_at is None
+            or time.monotonic() - opened_at >= self.max_lifetime
+        )
+
+    def get(self, connect):
+        """Свободное соединение, новое (если есть место) или ожидание."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            connection = None
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        registry.inc('db_pool_timeouts_total', (self.alias,))
+                        raise PoolTimeout(
+                            f'Нет свободного соединения с БД {self.alias} '
+                            f'за {self.timeout} с'
+                        )
+                    self.condition.wait(remaining)
+                if self.idle:
+                    connection = self.idle.pop()
+                else:
+                    self.opening += 1
+            if connection is None:
+                try:
+                    connection = self._open(connect)
+                finally:
+                    with self.condition:
+                        self.opening -= 1
+                        self.condition.notify()
+            elif not self._is_usable(connection):
+                self._discard(connection)
+                continue
+            registry.observe(
+                'db_pool_wait_seconds', (self.alias,),
+                time.monotonic() - started
+            )
+            return connection
+
+    def put(self, connection):
+        """Возвращает соединение; сломанные и старые закрываются."""
+        if not connection.closed and (
+            connection.info.transaction_status
+            != extensions.TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except base.Database.Error:
+                pass
+        if (
+            connection.closed
+            or connection.info.transaction_status
+            != extensions.TRANSACTION_STATUS_IDLE
+            or self._is_expired(connection)
+        ):
+            self._discard(connection)
+            return
+        connection.autocommit = True
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def fill(self, connect):
+        """Открывает соединения до min_size (прогрев при старте)."""
+        while self.size < self.min_size:
+            self.put(self._open(connect))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pooled = True
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        key = (self.alias, os.getpid())
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                options = {
+                    **DEFAULT_POOL_OPTIONS,
+                    **self.settings_dict['OPTIONS'].get('pool', {}),
+                }
+                pool = self._pools[key] = ConnectionPool(
+                    self.alias,
+                    health_checks=self.settings_dict['CONN_HEALTH_CHECKS'],
+                    **options
+                )
+        return pool
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def _connect(self, conn_params):
+        return lambda: super(DatabaseWrapper, self).get_new_connection(
+            conn_params
+        )
+
+    def get_new_connection(self, conn_params):
+        return self.pool.get(self._connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.put(self.connection)
+
+    def warm_up(self):
+        with self.wrap_database_errors:
+            self.pool.fill(self._connect(self.get_connection_params()))
@@ -0,0 +1,102 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+'''Чтение с реплик.
+ReplicaReadMixin направляет чтения GET/HEAD/OPTIONS-запросов вьюхи на
+одну из реплик DATABASE_REPLICAS; всё остальное (запись, проверка
+токена, фоновые задачи, команды) идёт в default. После успешного
+изменяющего запроса пользователь на REPLICA_PIN_SECONDS закрепляется за
+основной базой, чтобы видеть свои изменения, пока реплика отстаёт.
+Отметка хранится в общем кэше, поэтому при нескольких воркерах он должен
+быть общим (SHARED_CACHE_LOCATION). Значения, которые кладутся в общий
+кэш под новой версией, читаются внутри primary(): иначе отставшая
+реплика закэширует старые данные.'''
+
+PIN_KEY = 'db:pin:{}'
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def read_from(alias):
+    """Чтение внутри блока идёт в alias (None - в default)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary():
+    return read_from(None)
+
+
+def _pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def pin_to_primary(user):
+    if user.is_authenticated and settings.DATABASE_REPLICAS:
+        _pin_cache().set(
+            PIN_KEY.format(user.pk), True, settings.REPLICA_PIN_SECONDS
+        )
+
+
+def is_pinned(user):
+    return (
+        user.is_authenticated
+        and _pin_cache().get(PIN_KEY.format(user.pk), False)
+    )
+
+
+def replica_for(request, user):
+    """Реплика для чтения в этом запросе или None."""
+    if (
+        settings.DATABASE_REPLICAS
+        and request.method in SAFE_METHODS
+        and not is_pinned(user)
+    ):
+        return random.choice(settings.DATABASE_REPLICAS)
+    return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии default, объекты из них связаны с ним.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики репликацией.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы вьюхи читают с реплики."""
+    def dispatch(self, request, *args, **kwargs):
+        with primary():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # Аутентификация и проверка прав - ещё на основной базе:
+        # только что выданного токена на реплике может не быть.
+        super().initial(request, *args, **kwargs)
+        _read_alias.set(replica_for(request, request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,313 @@
+import bisect
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework import serializers
+
+'''Метрики запросов.
+MetricsMiddleware считает для каждого запроса число SQL-запросов и время
+в БД (через execute_wrapper), время сериализации и размер ответа. Итоги
+отдаются клиенту в заголовке Server-Timing и копятся в гистограммах по
+вьюхам, которые отдаёт metrics_view в текстовом формате Prometheus.
+Гистограммы живут в памяти процесса: у каждого воркера свои.
+Одинаковые по форме запросы, повторённые в одном запросе много раз,
+пишутся в лог как вероятный N+1.'''
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Числа и строки в SQL заменяются, списки IN (...) схлопываются.
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+
+VIEW_LABELS = ('view', 'method')
+
+_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.querying = False
+        self.shapes = Counter()
+
+
+def sql_shape(sql):
+    return SQL_IN_LIST.sub('IN (...)', SQL_LITERAL.sub('%s', sql))
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _stats.get()
+    # Под ASGI обёртка может стоять на соединении дважды.
+    if stats is None or stats.querying:
+        return execute(sql, params, many, context)
+    stats.querying = True
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.querying = False
+        stats.sql_time += time.perf_counter() - started
+        stats.queries += 1
+        stats.shapes[sql_shape(sql)] += 1
+
+
+def _timed_data(prop):
+    """Время сериализации: оборачивает свойство data сериализатора."""
+    def data(self):
+        stats = _stats.get()
+        if stats is None or stats.serializing:
+            return prop.fget(self)
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializing = False
+    data.timed = True
+    return property(data)
+
+
+def install_serializer_timing():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'timed', False):
+            cls.data = _timed_data(cls.data)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Гистограммы и счётчики по меткам (view, method)."""
+    HISTOGRAMS = {
+        'request_duration_seconds': (
+            DURATION_BUCKETS, 'Время обработки запроса'
+        ),
+        'request_db_seconds': (DURATION_BUCKETS, 'Время SQL-запросов'),
+        'request_serializer_seconds': (
+            DURATION_BUCKETS, 'Время сериализации'
+        ),
+        'request_queries': (QUERY_BUCKETS, 'Число SQL-запросов'),
+        'response_size_bytes': (SIZE_BUCKETS, 'Размер ответа'),
+        'db_pool_wait_seconds': (
+            WAIT_BUCKETS, 'Ожидание соединения из пула'
+        ),
+    }
+    COUNTERS = {
+        'n_plus_one_total': 'Запросы с признаками N+1',
+        'db_connections_opened_total': 'Открыто соединений с БД',
+        'db_pool_timeouts_total': 'Не дождались соединения из пула',
+    }
+    # Метрики БД размечены алиасом базы, остальные - вьюхой и методом.
+    LABEL_NAMES = {
+        'db_pool_wait_seconds': ('alias',),
+        'db_connections_opened_total': ('alias',),
+        'db_pool_timeouts_total': ('alias',),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {
+            name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+            for name, (buckets, _) in self.HISTOGRAMS.items()
+        }
+        self.counters = {name: Counter() for name in self.COUNTERS}
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self.histograms[name][labels].observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name][labels] += value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (buckets, help_text) in self.HISTOGRAMS.items():
+                metric = f'{settings.METRICS_PREFIX}{name}'
+                lines += [
+                    f'# HELP {metric} {help_text}',
+                    f'# TYPE {metric} histogram',
+                ]
+                names = self.LABEL_NAMES.get(name, VIEW_LABELS)
+                for labels, histogram in self.histograms[name].items():
+                    label_text = _labels(names, labels)
+                    total = 0
+                    for bound, count in zip(
+                        buckets + ('+Inf',), histogram.counts
+                    ):
+                        total += count
+                        lines.append(
+                            f'{metric}_bucket{{{label_text},le="{bound}"}} '
+                            f'{total}'
+                        )
+                    lines += [
+                        f'{metric}_sum{{{label_text}}} {histogram.sum}',
+                        f'{metric}_count{{{label_text}}} {total}',
+                    ]
+            for name, help_text in self.COUNTERS.items():
+                metric = f'{settings.METRICS_PREFIX}{name}'
+                lines += [
+                    f'# HELP {metric} {help_text}',
+                    f'# TYPE {metric} counter',
+                ]
+                names = self.LABEL_NAMES.get(name, VIEW_LABELS)
+                for labels, value in self.counters[name].items():
+                    lines.append(
+                        f'{metric}{{{_labels(names, labels)}}} {value}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name, value.replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in zip(names, labels)
+    )
+
+
+registry = Registry()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    # Соединения из пула считает сам пул: connect() там не значит open.
+    if settings.METRICS_ENABLED and not getattr(connection, 'pooled', False):
+        registry.inc('db_connections_opened_total', (connection.alias,))
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+def _record_queries(stack):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(record_query))
+
+
+class MetricsMiddleware:
+    # Под ASGI не переводит async-вьюхи в поток.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install_serializer_timing()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _record_queries(stack)
+                response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        # Соединения у каждого потока свои, а запросы к базе идут из
+        # потока sync_to_async (один на запрос) - обёртки ставятся там.
+        stack = ExitStack()
+        await sync_to_async(_record_queries)(stack)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+
+        labels = (_view_name(request), request.method)
+        registry.observe('request_duration_seconds', labels, duration)
+        registry.observe('request_db_seconds', labels, stats.sql_time)
+        registry.observe(
+            'request_serializer_seconds', labels, stats.serializer_time
+        )
+        registry.observe('request_queries', labels, stats.queries)
+        # Размер потокового ответа заранее неизвестен.
+        if not response.streaming:
+            registry.observe(
+                'response_size_bytes', labels, len(response.content)
+            )
+        self.check_n_plus_one(request, labels, stats)
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+    def check_n_plus_one(self, request, labels, stats):
+        repeated = [
+            (shape, count) for shape, count in stats.shapes.items()
+            if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD
+        ]
+        if not repeated:
+            return
+        registry.inc('n_plus_one_total', labels)
+        for shape, count in repeated:
+            logger.warning(
+                'Возможный N+1 в %s %s: %d одинаковых запросов: %s',
+                request.method, request.path, count, shape
+            )
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        return HttpResponse(status=404)
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
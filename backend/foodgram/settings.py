@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +58,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Async-версии GET-эндпоинтов (apps/recipes/async_views.py); включаются
+# в foodgram/asgi.py, под WSGI не нужны.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
 
 DATABASES = {
     'default': {
@@ -66,9 +72,30 @@ DATABASES = {
         "PASSWORD": os.getenv('POSTGRES_PASSWORD', 'postgres'),
         "HOST": os.getenv('DB_HOST', 'db'),
         "PORT": os.getenv('DB_PORT', 5432),
+        # Соединение живёт между запросами и проверяется перед
+        # повторным использованием.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул соединений в процессе (foodgram/db_pool): вместо закрытия в конце
+# запроса соединение возвращается в пул. max_size - не больше потоков
+# воркера; timeout - сколько секунд ждать свободного соединения.
+if os.getenv('DB_POOL', 'False') == 'True':
+    DATABASES['default'].update(
+        ENGINE='foodgram.db_pool',
+        CONN_MAX_AGE=0,
+        OPTIONS={'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_lifetime': int(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+        }}
+    )
+# Открыть соединения при старте воркера (foodgram/wsgi.py).
+DATABASE_WARM_UP = os.getenv('DB_WARM_UP', 'True') == 'True'
+
 if DEBUG == True:
     DATABASES = {
         'default': {
@@ -77,6 +104,66 @@ if DEBUG == True:
         }
     }    
 
+# Реплики для чтения (foodgram/db_router.py): DB_REPLICAS - хосты
+# PostgreSQL через запятую (host или host:port), в DEBUG - пути к файлам
+# SQLite. Локально можно указать тот же db.sqlite3 или его копию.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DEBUG:
+        DATABASES[alias]['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias]['HOST'] = host
+        DATABASES[alias]['PORT'] = port or DATABASES['default']['PORT']
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'local',
+    },
+}
+
+# Общий для всех воркеров кэш (например, Redis); без него версии
+# и ответы хранятся в памяти процесса.
+if os.getenv('SHARED_CACHE_LOCATION'):
+    CACHES['shared'] = {
+        'BACKEND': os.getenv(
+            'SHARED_CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache'
+        ),
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION'),
+    }
+
+RESPONSE_CACHE_LOCAL_ALIAS = 'local'
+RESPONSE_CACHE_SHARED_ALIAS = 'shared' if 'shared' in CACHES else 'default'
+RESPONSE_CACHE_LOCAL_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_LOCAL_TIMEOUT', 5)
+)
+RESPONSE_CACHE_SHARED_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_SHARED_TIMEOUT', 300)
+)
+
+# Кэш токенов (apps/users/authentication.py).
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 30))
+AUTH_TOKEN_CACHE_SHARED_ALIAS = 'shared' if 'shared' in CACHES else None
+AUTH_TOKEN_SHARED_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_SHARED_CACHE_TIMEOUT', 600)
+)
+
+# Сколько секунд после записи пользователь читает с основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE_ALIAS = RESPONSE_CACHE_SHARED_ALIAS
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,6 +194,56 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Сколько минут не удалять файлы без ссылок (см. apps/recipes/storage.py).
+MEDIA_GRACE_MINUTES = int(os.getenv('MEDIA_GRACE_MINUTES', 60))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'apps.recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+INGREDIENT_INDEX_ENABLED = os.getenv(
+    'INGREDIENT_INDEX_ENABLED', 'True'
+) == 'True'
+# Как часто индекс ингредиентов сверяет версию с базой, а не только с кэшем.
+INGREDIENT_INDEX_CHECK_INTERVAL = int(
+    os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', 60)
+)
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Полнотекстовый поиск рецептов (apps/recipes/search.py).
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 200))
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', 300))
+SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', 300))
+
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+)
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 4096))
+IMAGE_THUMBNAIL_SIZE = (480, 480)
+IMAGE_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_PIPELINE_EAGER = os.getenv('IMAGE_PIPELINE_EAGER', 'False') == 'True'
+# Картинка приходит в JSON как base64 (+1/3 к размеру).
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_MAX_UPLOAD_SIZE * 4 // 3 + 1024 * 1024
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Метрики запросов (foodgram/metrics.py). Эндпоинт /metrics/ nginx
+# наружу не проксирует.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_PREFIX = 'foodgram_'
+METRICS_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 5)
+)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -114,7 +251,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -124,6 +261,21 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 300)
+)
+PAGINATION_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_THRESHOLD', 100000)
+)
+
+# Лента подписок (apps/recipes/feed.py).
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', 1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+FEED_BATCH_SIZE = 1000
+
+# Сколько рецептов можно передать в favorite/batch и shopping_cart/batch.
+RECIPE_BATCH_MAX_SIZE = int(os.getenv('RECIPE_BATCH_MAX_SIZE', 100))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from apps.recipes.views import recipe_redirect
+from foodgram.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,6 +11,7 @@ urlpatterns = [
     path('api/', include('apps.recipes.urls')),
     path('api/auth/', include('djoser.urls.authtoken')),
     path('s/<int:recipe_id>/', recipe_redirect, name='recipe_short_url'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -4,4 +4,16 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.DATABASE_WARM_UP:
+    from foodgram.db_pool import warm_up_connections  # noqa: E402
+
+    warm_up_connections()
+
+if settings.INGREDIENT_INDEX_ENABLED:
+    from apps.recipes.ingredient_index import ingredient_index  # noqa: E402
+
+    ingredient_index.warm_up()